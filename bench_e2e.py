@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""End-to-end offline benchmark: KB load and !ask latency with local stand-ins for every service
+
+Drives FreshdeskKBBot directly against a fake Freshdesk API, a fake
+OpenAI-compatible endpoint and an in-memory Sheets service (see bench_fakes.py).
+Only the embedding model itself is real, so run it once online to cache the model.
+
+Usage: python3 bench_e2e.py [--users 10] [--asks 5] [--categories 5] [--folders 4] [--articles 40]
+                            [--openai-first-token 0.3] [--openai-token-delay 0.02] [--json results.json]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from bench_fakes import FakeContext, FakeFreshdesk, FakeOpenAI, FakeSheetsService, serve
+from main import FreshdeskKBBot, GoogleSheetsLogger
+
+
+def percentiles(samples):
+    if not samples:
+        return {'p50': None, 'p95': None, 'p99': None}
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {'p50': float(p50), 'p95': float(p95), 'p99': float(p99)}
+
+
+def make_questions(freshdesk, count, rng):
+    """Questions quoting topics and product codes from the generated articles"""
+    templates = [
+        "What is our process for {topic}?",
+        "How do I handle {topic} for a new client?",
+        "Can you explain the {topic} steps for {code}?",
+        "What should I check before {topic}?",
+    ]
+    articles = freshdesk.published
+    questions = []
+    for _ in range(count):
+        article = rng.choice(articles)
+        topic, code = article['title'].rsplit(' (', 1)
+        questions.append(rng.choice(templates).format(topic=topic.lower(), code=code.rstrip(')')))
+    return questions
+
+
+async def run(args):
+    freshdesk = FakeFreshdesk(
+        FreshdeskKBBot.ALLOWED_CATEGORIES, args.categories, args.folders, args.articles,
+        latency=args.freshdesk_latency, rate_limit=args.rate_limit
+    )
+    openai = FakeOpenAI(args.openai_first_token, args.openai_token_delay, args.answer_tokens)
+    sheets = FakeSheetsService(args.sheets_latency)
+    freshdesk_runner, freshdesk_url = await serve(freshdesk.app())
+    openai_runner, openai_url = await serve(openai.app())
+    os.environ['OPENAI_BASE_URL'] = f"{openai_url}/v1"
+
+    results = {'config': vars(args).copy()}
+    with tempfile.TemporaryDirectory() as tmp:
+        FreshdeskKBBot.EMBEDDING_STORE_DIR = args.embedding_store or os.path.join(tmp, 'embedding_store')
+        FreshdeskKBBot.KB_SNAPSHOT_DIR = os.path.join(tmp, 'kb_snapshot')
+        GoogleSheetsLogger.ROW_INDEX_PATH = os.path.join(tmp, 'sheets_row_index.json')
+        if args.edit_interval is not None:
+            FreshdeskKBBot.DISCORD_EDIT_INTERVAL = args.edit_interval
+
+        bot = FreshdeskKBBot('bench-token', 'bench', 'bench-key', 'sk-bench', '{}', 'bench-sheet',
+                             sheets_service=sheets)
+        bot.base_url = f"{freshdesk_url}/api/v2"
+
+        # Cold start: sheet header check, model load and full KB crawl + embedding, as in setup_hook
+        start = time.perf_counter()
+        await asyncio.gather(bot.warm_up(), asyncio.to_thread(bot.sheets_logger.initialize_sheet))
+        phases = dict(bot.startup.phases)
+        results['load'] = {
+            'seconds': time.perf_counter() - start,
+            'crawl_seconds': phases.get('crawl'),
+            'embed_seconds': phases.get('embed'),
+            'model_load_seconds': phases.get('model load'),
+            'freshdesk_requests': freshdesk.requests,
+            'freshdesk_throttled': freshdesk.throttled,
+            'freshdesk_retries': bot.freshdesk.retries,
+            'articles': len(bot.kb),
+            'passages': bot.kb.passage_count,
+        }
+
+        # Raw embedding throughput, independent of the embedding store
+        kb = bot.kb
+        texts = [bot.article_embedding_text(kb.articles[int(kb.passage_positions[row])], kb.passage_text(row))
+                 for row in range(min(args.embed_sample, kb.passage_count))]
+        start = time.perf_counter()
+        await asyncio.to_thread(bot.encode_texts, texts)
+        results['embedding'] = {'texts': len(texts), 'texts_per_second': len(texts) / (time.perf_counter() - start)}
+
+        # Incremental refresh after a few articles change
+        changed = freshdesk.touch(args.changed_articles)
+        requests_before, not_modified_before = freshdesk.requests, freshdesk.not_modified
+        start = time.perf_counter()
+        await bot.load_kb_articles()
+        results['refresh'] = {
+            'seconds': time.perf_counter() - start,
+            'changed_articles': len(changed),
+            'freshdesk_requests': freshdesk.requests - requests_before,
+            'freshdesk_not_modified': freshdesk.not_modified - not_modified_before,
+        }
+
+        # !ask load: each simulated user asks its questions one after another
+        rng = random.Random(args.seed)
+        questions = make_questions(freshdesk, args.distinct_questions, rng)
+
+        # Warm boot: a second bot restores the snapshot the first one wrote and answers before its refresh ends
+        rebooted = FreshdeskKBBot('bench-token', 'bench', 'bench-key', 'sk-bench', '{}', 'bench-sheet',
+                                  sheets_service=FakeSheetsService(args.sheets_latency))
+        rebooted.base_url = f"{freshdesk_url}/api/v2"
+        start = time.perf_counter()
+        warm_up = asyncio.create_task(rebooted.warm_up())
+        while rebooted.kb_source is None and not warm_up.done():
+            await asyncio.sleep(0.005)
+        restored = time.perf_counter() - start
+        ctx = FakeContext(0)
+        answered_from = rebooted.kb_source
+        await rebooted.bot.get_command('ask').callback(ctx, question=questions[0])
+        first_answer = time.perf_counter() - start
+        await warm_up
+        results['warm_boot'] = {
+            'restored_seconds': restored,
+            'first_answer_seconds': first_answer,
+            'answered_from': answered_from,
+            'ready_seconds': time.perf_counter() - start,
+        }
+        await rebooted.sheets_logger.close()
+        await rebooted.freshdesk.close()
+        ask = bot.bot.get_command('ask').callback
+        latencies, first_updates = [], []
+        rejected = 0
+
+        async def user(user_id):
+            nonlocal rejected
+            for _ in range(args.asks):
+                ctx = FakeContext(user_id, channel_id=user_id % args.channels)
+                start = time.perf_counter()
+                await ask(ctx, question=rng.choice(questions))
+                if any(m.content == bot.BUSY_MESSAGE for m in ctx.messages):
+                    rejected += 1
+                    continue
+                latencies.append(time.perf_counter() - start)
+                updates = [m.first_update for m in ctx.messages if m.first_update is not None]
+                if updates:
+                    first_updates.append(min(updates) - start)
+
+        openai_calls_before = openai.calls
+        start = time.perf_counter()
+        await asyncio.gather(*(user(user_id) for user_id in range(args.users)))
+        wall = time.perf_counter() - start
+        await bot.sheets_logger.close()
+        await bot.freshdesk.close()
+
+        results['ask'] = {
+            'users': args.users,
+            'asks': len(latencies),
+            'rejected': rejected,
+            'wall_seconds': wall,
+            'throughput_per_second': len(latencies) / wall if wall else None,
+            'latency_seconds': percentiles(latencies),
+            'first_update_seconds': percentiles(first_updates),
+            'openai_calls': openai.calls - openai_calls_before,
+            'answer_cache_hits': bot.answer_cache.hits,
+            'lexical_fast_path': len(bot.retrieval_latency.samples.get('lexical fast path', ())),
+            'avg_prompt_tokens': (bot.token_usage['prompt'] / bot.token_usage['requests']
+                                  if bot.token_usage['requests'] else None),
+            'sheets_rows_logged': max(0, len(sheets.rows) - 1),
+            'sheets_calls': dict(sheets.calls),
+        }
+
+    await freshdesk_runner.cleanup()
+    await openai_runner.cleanup()
+    return results
+
+
+def report(results):
+    load, embedding, refresh, ask = results['load'], results['embedding'], results['refresh'], results['ask']
+    warm = results['warm_boot']
+
+    def ms(value):
+        return f"{value * 1000:.0f} ms" if value is not None else "n/a"
+
+    def seconds(value):
+        return f"{value:.2f}s" if value is not None else "n/a"
+
+    print("=== KB load ===")
+    print(f"Cold load: {seconds(load['seconds'])} (model {seconds(load['model_load_seconds'])}, "
+          f"crawl {seconds(load['crawl_seconds'])}, embed {seconds(load['embed_seconds'])})")
+    print(f"Articles: {load['articles']}, passages: {load['passages']}, "
+          f"Freshdesk requests: {load['freshdesk_requests']} ({load['freshdesk_throttled']} throttled, "
+          f"{load['freshdesk_retries']} retried)")
+    print(f"Embedding throughput: {embedding['texts_per_second']:.1f} texts/s over {embedding['texts']} passages")
+    print(f"Incremental refresh with {refresh['changed_articles']} changed articles: "
+          f"{seconds(refresh['seconds'])}, {refresh['freshdesk_requests']} Freshdesk requests "
+          f"({refresh['freshdesk_not_modified']} not modified)")
+    print(f"Warm boot from snapshot: restored in {seconds(warm['restored_seconds'])}, "
+          f"first answer at {seconds(warm['first_answer_seconds'])} (from {warm['answered_from']}), "
+          f"refreshed in {seconds(warm['ready_seconds'])}")
+
+    print(f"\n=== !ask with {ask['users']} concurrent users ===")
+    latency, first = ask['latency_seconds'], ask['first_update_seconds']
+    print(f"{ask['asks']} asks in {seconds(ask['wall_seconds'])} ({ask['throughput_per_second']:.2f} asks/s), "
+          f"{ask['rejected']} rejected as busy")
+    print(f"Latency: p50 {ms(latency['p50'])}, p95 {ms(latency['p95'])}, p99 {ms(latency['p99'])}")
+    print(f"First streamed update: p50 {ms(first['p50'])}, p95 {ms(first['p95'])}, p99 {ms(first['p99'])}")
+    prompt_tokens = f"{ask['avg_prompt_tokens']:.0f}" if ask['avg_prompt_tokens'] is not None else "n/a"
+    print(f"OpenAI calls: {ask['openai_calls']}, answer cache hits: {ask['answer_cache_hits']}, "
+          f"lexical fast path: {ask['lexical_fast_path']}, avg prompt tokens: {prompt_tokens}")
+    print(f"Sheets rows logged: {ask['sheets_rows_logged']}, calls: {ask['sheets_calls']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=10, help="concurrent simulated users")
+    parser.add_argument('--asks', type=int, default=5, help="questions asked by each user")
+    parser.add_argument('--channels', type=int, default=3, help="Discord channels the users are spread over")
+    parser.add_argument('--distinct-questions', type=int, default=100)
+    parser.add_argument('--categories', type=int, default=5)
+    parser.add_argument('--folders', type=int, default=4, help="folders per category")
+    parser.add_argument('--articles', type=int, default=40, help="articles per folder")
+    parser.add_argument('--changed-articles', type=int, default=5, help="articles edited before the refresh")
+    parser.add_argument('--freshdesk-latency', type=float, default=0.02)
+    parser.add_argument('--rate-limit', type=int, default=5000, help="Freshdesk requests per minute")
+    parser.add_argument('--openai-first-token', type=float, default=0.3)
+    parser.add_argument('--openai-token-delay', type=float, default=0.02)
+    parser.add_argument('--answer-tokens', type=int, default=60)
+    parser.add_argument('--sheets-latency', type=float, default=0.1)
+    parser.add_argument('--edit-interval', type=float, help="override DISCORD_EDIT_INTERVAL")
+    parser.add_argument('--embed-sample', type=int, default=256, help="passages used for the raw throughput test")
+    parser.add_argument('--embedding-store', help="reuse this embedding store instead of a cold temporary one")
+    parser.add_argument('--model', help="override the embedding model name or path")
+    parser.add_argument('--embedding-backend', choices=['torch', 'onnx'], help="override EMBEDDING_BACKEND")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="also write the results to this file")
+    parser.add_argument('--verbose', action='store_true', help="show the bot's own console output")
+    args = parser.parse_args()
+
+    if args.model:
+        FreshdeskKBBot.EMBEDDING_MODEL_NAME = args.model
+    if args.embedding_backend:
+        FreshdeskKBBot.EMBEDDING_BACKEND = args.embedding_backend
+
+    bot_output = io.StringIO()
+    with contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(bot_output):
+        results = asyncio.run(run(args))
+
+    report(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
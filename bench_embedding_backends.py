@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""Parity check and latency/RSS comparison of the torch and ONNX embedding backends
+
+Each backend runs in its own subprocess so resident memory can be compared fairly.
+Exits non-zero if the ONNX embeddings drift from the PyTorch ones by more than
+--min-cosine allows.
+
+Usage: python3 bench_embedding_backends.py [--model all-MiniLM-L6-v2] [--threads 4] [--min-cosine 0.98]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+TOPICS = ["corporate gift order", "customer success training", "delivery lead time",
+          "artwork approval", "invoice payment terms", "sample request", "bulk pricing",
+          "packaging options", "refund policy", "product specification"]
+TEMPLATES = ["How do I handle a {} for a new client?",
+             "Category: Workflow\nFolder: Orders\nTitle: {}\n\nSteps our team follows when dealing with a {} request.",
+             "What is our policy on {} when the customer is overseas?",
+             "Checklist for {}: confirm quantities, confirm deadline, update the ticket and notify the designer."]
+
+
+def corpus():
+    return [template.format(topic, topic) for topic in TOPICS for template in TEMPLATES]
+
+
+def current_rss_mb():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+
+
+def run_worker(args):
+    """Load one backend, time it, and dump its embeddings for the parity check"""
+    from main import OnnxEmbeddingBackend, SentenceTransformerBackend
+
+    texts = corpus()
+    rss_before = current_rss_mb()
+
+    start = time.perf_counter()
+    if args.worker == 'onnx':
+        backend = OnnxEmbeddingBackend(args.model, args.threads, args.onnx_dir)
+    else:
+        backend = SentenceTransformerBackend(args.model, args.threads)
+    load_seconds = time.perf_counter() - start
+
+    backend.encode(texts[:2])  # warm up
+    start = time.perf_counter()
+    embeddings = np.asarray(backend.encode(texts), dtype=np.float32)
+    batch_seconds = time.perf_counter() - start
+
+    latencies = []
+    for text in texts[:args.queries]:
+        start = time.perf_counter()
+        backend.encode([text])
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    np.save(args.output, embeddings)
+    print(json.dumps({
+        'backend': args.worker,
+        'load_s': load_seconds,
+        'batch_texts_per_s': len(texts) / batch_seconds,
+        'query_p50_ms': float(np.percentile(latencies, 50)),
+        'query_p95_ms': float(np.percentile(latencies, 95)),
+        'rss_mb': current_rss_mb() - rss_before,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--model', default='all-MiniLM-L6-v2')
+    parser.add_argument('--threads', type=int, default=int(os.getenv('EMBEDDING_THREADS', '4')))
+    parser.add_argument('--onnx-dir', default=os.getenv('ONNX_MODEL_DIR', 'onnx_model'))
+    parser.add_argument('--queries', type=int, default=20)
+    parser.add_argument('--min-cosine', type=float, default=0.98)
+    parser.add_argument('--worker', choices=['torch', 'onnx'], help=argparse.SUPPRESS)
+    parser.add_argument('--output', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return 0
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in ('torch', 'onnx'):
+            output = os.path.join(tmp, f'{backend}.npy')
+            completed = subprocess.run(
+                [sys.executable, __file__, '--worker', backend, '--output', output,
+                 '--model', args.model, '--threads', str(args.threads),
+                 '--onnx-dir', args.onnx_dir, '--queries', str(args.queries)],
+                capture_output=True, text=True
+            )
+            if completed.returncode != 0:
+                print(completed.stdout + completed.stderr)
+                print(f"❌ {backend} backend failed")
+                return 1
+            stats = json.loads(completed.stdout.strip().splitlines()[-1])
+            stats['embeddings'] = np.load(output)
+            results[backend] = stats
+
+    print(f"{'backend':<8} {'load s':>7} {'texts/s':>9} {'p50 ms':>7} {'p95 ms':>7} {'+RSS MB':>8} {'peak MB':>8}")
+    for backend, stats in results.items():
+        print(f"{backend:<8} {stats['load_s']:>7.2f} {stats['batch_texts_per_s']:>9.1f} "
+              f"{stats['query_p50_ms']:>7.2f} {stats['query_p95_ms']:>7.2f} "
+              f"{stats['rss_mb']:>8.1f} {stats['peak_rss_mb']:>8.1f}")
+
+    reference, candidate = results['torch']['embeddings'], results['onnx']['embeddings']
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    cosines = (reference * candidate).sum(axis=1)
+    # Nearest neighbour of every text within the corpus should not change
+    same_neighbour = np.mean(
+        np.argsort(reference @ reference.T, axis=1)[:, -2] == np.argsort(candidate @ candidate.T, axis=1)[:, -2]
+    )
+
+    print(f"\nParity: min cosine {cosines.min():.4f}, mean cosine {cosines.mean():.4f}, "
+          f"nearest-neighbour agreement {same_neighbour:.1%}")
+    if cosines.min() < args.min_cosine:
+        print(f"❌ ONNX embeddings diverge from PyTorch (min cosine below {args.min_cosine})")
+        return 1
+    print("✅ ONNX backend is compatible with the PyTorch index")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
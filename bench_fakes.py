@@ -0,0 +1,348 @@
+"""Local stand-ins for the services the bot talks to, used by the offline benchmarks
+
+- FakeFreshdesk: solutions API (categories, folders, paginated article lists,
+  article details) with latency, X-Ratelimit-* headers and ETag revalidation
+- FakeOpenAI: OpenAI-compatible chat completions endpoint, streaming or not,
+  with configurable time to first token and per-token delay
+- FakeSheetsService: in-memory replacement for the googleapiclient Sheets service
+- FakeContext / FakeMessage: just enough of discord.py's Context and Message
+  to drive a command callback
+"""
+import asyncio
+import hashlib
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+
+from aiohttp import web
+
+TOPICS = [
+    "corporate gift order", "artwork approval", "delivery lead time", "invoice payment terms",
+    "sample request", "bulk pricing", "packaging options", "refund policy", "onboarding checklist",
+    "customer success training", "quotation workflow", "product specification", "logo printing",
+    "rush order", "overseas shipping", "damaged goods claim",
+]
+FILLER = (
+    "the team should confirm the details with the customer before updating the ticket and "
+    "make sure the designer and the supplier have the latest requirements so the order ships on time"
+).split()
+
+
+async def serve(app, host='127.0.0.1'):
+    """Start an aiohttp app on a free port; returns the runner and the base URL"""
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://{host}:{port}"
+
+
+class FakeFreshdesk:
+    """Freshdesk solutions API with a generated knowledge base
+
+    Categories take their names from `category_names` in order; any beyond
+    that list get names the bot does not index. Roughly one article in ten is
+    a draft. The per-minute rate limit is reported in X-Ratelimit-* headers
+    and enforced with 429 + Retry-After once used up. Responses carry an ETag,
+    and a matching If-None-Match gets an empty 304 (which still uses budget).
+    """
+
+    WINDOW = 60  # seconds per rate-limit window
+
+    def __init__(self, category_names, categories=5, folders=4, articles=40,
+                 latency=0.02, rate_limit=700, seed=0):
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.requests = 0
+        self.throttled = 0
+        self.not_modified = 0
+        self._window_start = time.monotonic()
+        self._window_used = 0
+        self._rng = random.Random(seed)
+
+        self.categories = []
+        self.folders = {}  # category id -> folder list
+        self.listings = {}  # folder id -> article summaries
+        self.articles = {}  # article id -> article detail
+
+        article_ids = itertools.count(1000)
+        for c in range(categories):
+            name = category_names[c] if c < len(category_names) else f"Internal {c}"
+            category_id = c + 1
+            self.categories.append({'id': category_id, 'name': name})
+            self.folders[category_id] = []
+            for f in range(folders):
+                folder_id = category_id * 100 + f
+                self.folders[category_id].append({
+                    'id': folder_id, 'name': f"{name} Folder {f + 1}", 'articles_count': articles
+                })
+                self.listings[folder_id] = []
+                for _ in range(articles):
+                    article = self._make_article(next(article_ids), folder_id, category_id)
+                    self.articles[article['id']] = article
+                    self.listings[folder_id].append({
+                        key: article[key] for key in ('id', 'title', 'status', 'updated_at')
+                    })
+
+    def _make_article(self, article_id, folder_id, category_id):
+        topic = self._rng.choice(TOPICS)
+        code = f"EP-{article_id}"
+        words = [
+            self._rng.choice(FILLER if self._rng.random() < 0.8 else topic.split())
+            for _ in range(self._rng.randint(80, 600))
+        ]
+        return {
+            'id': article_id,
+            'title': f"{topic.title()} ({code})",
+            'description_text': f"This article covers {topic} for product {code}. " + ' '.join(words) + '.',
+            'status': 1 if self._rng.random() < 0.1 else 2,
+            'folder_id': folder_id,
+            'category_id': category_id,
+            'created_at': '2024-01-01T00:00:00Z',
+            'updated_at': '2024-01-01T00:00:00Z',
+        }
+
+    @property
+    def published(self):
+        return [article for article in self.articles.values() if article['status'] == 2]
+
+    def touch(self, count):
+        """Edit `count` published articles so the next incremental refresh picks them up"""
+        stamp = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        changed = self._rng.sample(self.published, min(count, len(self.published)))
+        for article in changed:
+            article['updated_at'] = stamp
+            article['description_text'] += " Updated with the latest supplier information."
+            for summary in self.listings[article['folder_id']]:
+                if summary['id'] == article['id']:
+                    summary['updated_at'] = stamp
+        return changed
+
+    def _take_budget(self):
+        now = time.monotonic()
+        if now - self._window_start >= self.WINDOW:
+            self._window_start, self._window_used = now, 0
+        if self._window_used >= self.rate_limit:
+            return None, self.WINDOW - (now - self._window_start)
+        self._window_used += 1
+        return self.rate_limit - self._window_used, 0
+
+    async def _respond(self, request, payload):
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        remaining, retry_after = self._take_budget()
+        if remaining is None:
+            self.throttled += 1
+            return web.json_response(
+                {'description': 'Rate limit exceeded'}, status=429,
+                headers={'Retry-After': str(int(retry_after) + 1), 'X-Ratelimit-Remaining': '0',
+                         'X-Ratelimit-Total': str(self.rate_limit)}
+            )
+        if payload is None:
+            return web.json_response({'code': 'not_found'}, status=404)
+        body = json.dumps(payload)
+        headers = {
+            'ETag': f'"{hashlib.sha1(body.encode()).hexdigest()}"',
+            'X-Ratelimit-Total': str(self.rate_limit),
+            'X-Ratelimit-Remaining': str(remaining),
+            'X-Ratelimit-Used-CurrentRequest': '1',
+        }
+        if request.headers.get('If-None-Match') == headers['ETag']:
+            self.not_modified += 1
+            return web.Response(status=304, headers=headers)
+        return web.Response(text=body, content_type='application/json', headers=headers)
+
+    def app(self):
+        async def categories(request):
+            return await self._respond(request, self.categories)
+
+        async def folders(request):
+            return await self._respond(request, self.folders.get(int(request.match_info['category_id'])))
+
+        async def folder_articles(request):
+            listing = self.listings.get(int(request.match_info['folder_id']))
+            if listing is None:
+                return await self._respond(request, None)
+            page = int(request.query.get('page', 1))
+            per_page = int(request.query.get('per_page', 30))
+            return await self._respond(request, listing[(page - 1) * per_page:page * per_page])
+
+        async def article(request):
+            return await self._respond(request, self.articles.get(int(request.match_info['article_id'])))
+
+        app = web.Application()
+        app.router.add_get('/api/v2/solutions/categories', categories)
+        app.router.add_get('/api/v2/solutions/categories/{category_id}/folders', folders)
+        app.router.add_get('/api/v2/solutions/folders/{folder_id}/articles', folder_articles)
+        app.router.add_get('/api/v2/solutions/articles/{article_id}', article)
+        return app
+
+
+class FakeOpenAI:
+    """OpenAI-compatible /v1/chat/completions endpoint returning a canned answer"""
+
+    def __init__(self, first_token_latency=0.3, token_delay=0.02, answer_tokens=60):
+        self.first_token_latency = first_token_latency
+        self.token_delay = token_delay
+        self.answer_tokens = answer_tokens
+        self.calls = 0
+        self.prompt_chars = 0
+
+    def answer(self):
+        words = itertools.cycle("Based on our knowledge base, here is what you need to know:".split() + FILLER)
+        return [next(words) + ' ' for _ in range(self.answer_tokens)]
+
+    def app(self):
+        async def chat_completions(request):
+            body = await request.json()
+            self.calls += 1
+            self.prompt_chars += sum(len(message.get('content', '')) for message in body.get('messages', []))
+            tokens = self.answer()
+            await asyncio.sleep(self.first_token_latency)
+
+            base = {'id': f"chatcmpl-{self.calls}", 'created': int(time.time()), 'model': body.get('model', 'fake')}
+            if not body.get('stream'):
+                await asyncio.sleep(self.token_delay * len(tokens))
+                return web.json_response(dict(base, object='chat.completion', choices=[{
+                    'index': 0, 'message': {'role': 'assistant', 'content': ''.join(tokens)}, 'finish_reason': 'stop'
+                }]))
+
+            response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+            await response.prepare(request)
+            for i, token in enumerate(tokens):
+                if i:
+                    await asyncio.sleep(self.token_delay)
+                chunk = dict(base, object='chat.completion.chunk', choices=[{
+                    'index': 0, 'delta': {'content': token}, 'finish_reason': None
+                }])
+                await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            final = dict(base, object='chat.completion.chunk', choices=[{'index': 0, 'delta': {}, 'finish_reason': 'stop'}])
+            await response.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode())
+            return response
+
+        app = web.Application()
+        app.router.add_post('/v1/chat/completions', chat_completions)
+        return app
+
+
+class FakeSheetsService:
+    """In-memory stand-in for build('sheets', 'v4'), covering the values get/append/update calls
+
+    Calls block for `latency` seconds like the real HTTP round trip; the logger
+    runs them in worker threads.
+    """
+
+    RANGE_PATTERN = re.compile(r'!([A-Z]+)(\d*)(?::([A-Z]+)(\d*))?')
+
+    def __init__(self, latency=0.1):
+        self.latency = latency
+        self.rows = []
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    @staticmethod
+    def _column(letters):
+        index = 0
+        for letter in letters:
+            index = index * 26 + ord(letter) - ord('A') + 1
+        return index - 1
+
+    def _parse(self, cell_range):
+        first_col, first_row, last_col, last_row = self.RANGE_PATTERN.search(cell_range).groups()
+        last_col = last_col or first_col
+        return (self._column(first_col), int(first_row) if first_row else 1,
+                self._column(last_col), int(last_row) if last_row else None)
+
+    def _request(self, name, action):
+        def execute():
+            time.sleep(self.latency)
+            with self._lock:
+                self.calls[name] += 1
+                return action()
+        return type('FakeSheetsRequest', (), {'execute': staticmethod(execute)})()
+
+    def get(self, spreadsheetId, range):
+        def action():
+            first_col, first_row, last_col, last_row = self._parse(range)
+            rows = self.rows[first_row - 1:last_row]
+            values = [row[first_col:last_col + 1] for row in rows]
+            return {'values': values} if any(values) else {}
+        return self._request('get', action)
+
+    def update(self, spreadsheetId, range, valueInputOption, body):
+        def action():
+            first_col, first_row, _, _ = self._parse(range)
+            for offset, values in enumerate(body['values']):
+                index = first_row - 1 + offset
+                while len(self.rows) <= index:
+                    self.rows.append([])
+                row = self.rows[index]
+                row.extend([''] * (first_col + len(values) - len(row)))
+                row[first_col:first_col + len(values)] = values
+            return {'updatedRows': len(body['values'])}
+        return self._request('update', action)
+
+    def append(self, spreadsheetId, range, valueInputOption, body, insertDataOption=None):
+        def action():
+            first_row = len(self.rows) + 1
+            self.rows.extend(list(values) for values in body['values'])
+            return {'updates': {'updatedRange': f"Sheet1!A{first_row}:G{len(self.rows)}",
+                                'updatedRows': len(body['values'])}}
+        return self._request('append', action)
+
+
+class FakeMessage:
+    _ids = itertools.count(1)
+
+    def __init__(self, content):
+        self.id = next(self._ids)
+        self.content = content
+        self.edits = 0
+        self.first_update = None
+
+    async def edit(self, content=None, view=None, **kwargs):
+        self.edits += 1
+        if content is not None:
+            self.content = content
+            # First streamed answer text (marked by the cursor) or the final answer; not status notices
+            if self.first_update is None and (content.endswith('▌') or view is not None):
+                self.first_update = time.perf_counter()
+
+    async def delete(self):
+        pass
+
+
+class FakeAuthor:
+    def __init__(self, user_id, bot=False):
+        self.id = user_id
+        self.bot = bot
+
+
+class FakeChannel:
+    def __init__(self, channel_id):
+        self.id = channel_id
+
+
+class FakeContext:
+    """Command context for one simulated user; records the messages the bot sends"""
+
+    def __init__(self, user_id, channel_id=0):
+        self.author = FakeAuthor(user_id)
+        self.channel = FakeChannel(channel_id)
+        self.messages = []
+
+    async def send(self, content=None, view=None, **kwargs):
+        message = FakeMessage(content)
+        self.messages.append(message)
+        return message
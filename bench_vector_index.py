@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""Microbenchmark: VectorIndex top-k search vs the old sklearn cosine_similarity + argsort path
+
+Usage: python3 bench_vector_index.py [--sizes 500 5000 50000] [--queries 200] [--k 3]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from main import VectorIndex
+
+DIM = 384  # all-MiniLM-L6-v2 embedding size
+
+
+def old_path(question_embedding, kb_embeddings, k):
+    """The retrieval code find_relevant_articles used before VectorIndex"""
+    from sklearn.metrics.pairwise import cosine_similarity
+
+    similarities = cosine_similarity(question_embedding.reshape(1, -1), kb_embeddings)[0]
+    top_indices = similarities.argsort()[-k:][::-1]
+    return top_indices, similarities[top_indices]
+
+
+def clustered_embeddings(rng, count, centroids):
+    """Synthetic embeddings grouped around topics, closer to real KB passages than pure noise"""
+    labels = rng.integers(0, len(centroids), size=count)
+    noise = rng.standard_normal((count, DIM)).astype(np.float32) * 0.5
+    return (centroids[labels] + noise).astype(np.float32)
+
+
+def time_per_query(search, queries):
+    search(queries[0])  # warm up lazy imports and caches
+    start = time.perf_counter()
+    results = [search(query) for query in queries]
+    return (time.perf_counter() - start) / len(queries) * 1e6, results
+
+
+def recall(results, reference):
+    hits = sum(len(set(r[0]) & set(ref[0])) for r, ref in zip(results, reference))
+    return hits / sum(len(ref[0]) for ref in reference)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[500, 5000, 50000])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'passages':>9} {'path':<22} {'build ms':>9} {'us/query':>9} {'recall':>7}")
+
+    centroids = rng.standard_normal((256, DIM)).astype(np.float32)
+
+    for size in args.sizes:
+        embeddings = clustered_embeddings(rng, size, centroids)
+        queries = clustered_embeddings(rng, args.queries, centroids)
+
+        try:
+            old_us, reference = time_per_query(lambda q: old_path(q, embeddings, args.k), queries)
+            print(f"{size:>9} {'sklearn + argsort':<22} {'-':>9} {old_us:>9.1f} {1.0:>7.3f}")
+        except ImportError:
+            reference = None
+            print(f"{size:>9} {'sklearn + argsort':<22} (scikit-learn not installed, skipped)")
+
+        for backend in ('exact', 'hnsw'):
+            start = time.perf_counter()
+            index = VectorIndex(embeddings, backend=backend)
+            build_ms = (time.perf_counter() - start) * 1000
+            label = f"VectorIndex/{index.backend.name}"
+            us, results = time_per_query(lambda q: index.search(q, args.k), queries)
+            if reference is None:
+                reference = results
+            print(f"{size:>9} {label:<22} {build_ms:>9.1f} {us:>9.1f} {recall(results, reference):>7.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,9 @@
 #!/usr/bin/env python3
+import time
+
+# Cold-start phases are measured from here
+PROCESS_START = time.perf_counter()
+
 from dotenv import load_dotenv
 import os
 
@@ -9,7 +14,8 @@ load_dotenv()
 
 from google.oauth2.service_account import Credentials
 from googleapiclient.discovery import build
-from datetime import datetime
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 import pytz
 import json
 import discord
@@ -17,23 +23,152 @@ from discord.ext import commands
 import aiohttp
 import asyncio
 import traceback
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
 import base64
-from openai import OpenAI
+import hashlib
+import hmac
+import random
+import re
+import math
+import mmap
+import heapq
+import pickle
+from openai import AsyncOpenAI
 from discord import ButtonStyle, Interaction
 from discord.ui import Button, View
-from flask import Flask
-from threading import Thread
-import time
-import torch
+from flask import Flask, Response, request, jsonify
+from threading import Thread, Lock
+from array import array
+from collections import OrderedDict, Counter, defaultdict, deque
+from collections.abc import Mapping, Sequence
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
 from keep_alive import keep_alive
 from typing import Optional, Union
 from discord import Message, Interaction, Member, User
 
 from google.oauth2.service_account import Credentials
 
+# torch and sentence_transformers are imported lazily when the embedding model loads
+IMPORTS_DONE = time.perf_counter()
+
+
+class Metrics:
+    """Thread-safe counters, gauges and latency histograms rendered in Prometheus text format
+
+    Metrics must be described before use. Collectors registered with
+    add_collector run at scrape time to refresh gauges derived from live state.
+    """
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+    def __init__(self):
+        self.descriptions = {}  # name -> (type, help)
+        self.values = {}  # name -> {label tuple: value, or [bucket counts, sum, count] for histograms}
+        self.collectors = []
+        self._lock = Lock()
+
+    def describe(self, name, kind, help_text):
+        self.descriptions[name] = (kind, help_text)
+        self.values.setdefault(name, {})
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def inc(self, name, value=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self.values[name][key] = self.values[name].get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self.values[name][tuple(sorted(labels.items()))] = value
+
+    def observe(self, name, seconds, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            histogram = self.values[name].get(key)
+            if histogram is None:
+                histogram = self.values[name][key] = [[0] * len(self.BUCKETS), 0.0, 0]
+            for i, bound in enumerate(self.BUCKETS):
+                if seconds <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observe the duration of the block, including any awaits inside it"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    @staticmethod
+    def _labels(key, extra=()):
+        pairs = list(key) + list(extra)
+        if not pairs:
+            return ''
+
+        def escape(value):
+            return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+        return '{' + ','.join(f'{label}="{escape(value)}"' for label, value in pairs) + '}'
+
+    def render(self):
+        for collector in self.collectors:
+            try:
+                collector()
+            except Exception as e:
+                print(f"Error collecting metrics: {str(e)}")
+
+        lines = []
+        with self._lock:
+            for name, (kind, help_text) in self.descriptions.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for key, value in self.values[name].items():
+                    if kind != 'histogram':
+                        lines.append(f"{name}{self._labels(key)} {value}")
+                        continue
+                    buckets, total, count = value
+                    for bound, bucket_count in zip(self.BUCKETS, buckets):
+                        lines.append(f"{name}_bucket{self._labels(key, [('le', bound)])} {bucket_count}")
+                    lines.append(f"{name}_bucket{self._labels(key, [('le', '+Inf')])} {count}")
+                    lines.append(f"{name}_sum{self._labels(key)} {total}")
+                    lines.append(f"{name}_count{self._labels(key)} {count}")
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+metrics.describe('kb_bot_stage_duration_seconds', 'histogram',
+                 'Duration of each stage of the answer and knowledge base refresh pipelines')
+metrics.describe('kb_bot_request_duration_seconds', 'histogram',
+                 'End-to-end duration of a question, from command to logged answer')
+metrics.describe('kb_bot_requests_total', 'counter', 'Questions handled, by source and outcome')
+metrics.describe('kb_bot_retrievals_total', 'counter', 'Retrievals by path (lexical fast path or hybrid)')
+metrics.describe('kb_bot_tokens_total', 'counter', 'OpenAI tokens used, by kind')
+metrics.describe('kb_bot_discord_edits_total', 'counter', 'Discord message edits made while streaming answers')
+metrics.describe('kb_bot_sheets_rows_total', 'counter', 'Interaction rows written to Google Sheets, by outcome')
+metrics.describe('kb_bot_freshdesk_requests_total', 'counter', 'Requests issued to the Freshdesk API')
+metrics.describe('kb_bot_freshdesk_retries_total', 'counter', 'Freshdesk requests retried, by status or network error')
+metrics.describe('kb_bot_freshdesk_rate_limit_remaining', 'gauge',
+                 'X-Ratelimit-Remaining reported by the latest Freshdesk response')
+metrics.describe('kb_bot_kb_articles', 'gauge', 'Articles in the knowledge base cache')
+metrics.describe('kb_bot_index_vectors', 'gauge', 'Passages in the vector index')
+metrics.describe('kb_bot_index_terms', 'gauge', 'Distinct terms in the BM25 index')
+metrics.describe('kb_bot_article_blob_bytes', 'gauge', 'Size of the on-disk article text blob in use')
+metrics.describe('kb_bot_embedding_matrix_bytes', 'gauge', 'Memory held by the passage embedding matrix')
+metrics.describe('kb_bot_last_refresh_duration_seconds', 'gauge', 'Duration of the last knowledge base refresh')
+metrics.describe('kb_bot_last_refresh_age_seconds', 'gauge', 'Seconds since the last knowledge base refresh finished')
+metrics.describe('kb_bot_cache_hits_total', 'counter', 'Cache hits, by cache')
+metrics.describe('kb_bot_cache_misses_total', 'counter', 'Cache misses, by cache')
+metrics.describe('kb_bot_cache_hit_ratio', 'gauge', 'Hit ratio since startup, by cache')
+metrics.describe('kb_bot_scheduler_running', 'gauge', 'Answers currently being generated')
+metrics.describe('kb_bot_scheduler_queued', 'gauge', 'Questions waiting for a free answer worker')
+metrics.describe('kb_bot_webhook_events_total', 'counter', 'Article webhook calls by event and outcome')
+
 # Flask app for keeping the bot alive
 app = Flask('')
 
@@ -41,6 +176,36 @@ app = Flask('')
 def home():
     return "Bot is alive"
 
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def secret_matches(headers, header, secret):
+    """Whether a request carries `secret` in the given header or as a Bearer token"""
+    supplied = headers.get(header, '')
+    authorization = headers.get('Authorization', '')
+    if not supplied and authorization.startswith('Bearer '):
+        supplied = authorization[len('Bearer '):].strip()
+    return hmac.compare_digest(supplied.encode('utf-8'), secret.encode('utf-8'))
+
+@app.route('/webhooks/freshdesk/article', methods=['POST'])
+def article_webhook():
+    """Freshdesk automation hook for a single article change; handled by the running bot"""
+    handler = app.config.get('ARTICLE_WEBHOOK')
+    if handler is None:
+        return jsonify({'error': 'bot is not running'}), 503
+    body, status = handler(request.headers, request.get_json(silent=True))
+    return jsonify(body), status
+
+@app.route('/api/ask', methods=['POST'])
+def batch_ask():
+    """Answer a batch of questions for machine clients; handled by the running bot"""
+    handler = app.config.get('BATCH_ASK')
+    if handler is None:
+        return jsonify({'error': 'bot is not running'}), 503
+    body, status = handler(request.headers, request.get_json(silent=True))
+    return jsonify(body), status
+
 def run_flask():
     port = int(os.getenv('PORT', 8080))
     app.run(host='0.0.0.0', port=port)
@@ -51,36 +216,61 @@ def keep_alive():
     server.start()
 
 class GoogleSheetsLogger:
-    def __init__(self, credentials_json, spreadsheet_id):
-        # Load credentials from the JSON string
-        creds_dict = json.loads(credentials_json)
-        credentials = Credentials.from_service_account_info(
-            creds_dict,
-            scopes=['https://www.googleapis.com/auth/spreadsheets']
-        )
+    # Logged rows are written behind: flushed in one append call once this many are queued...
+    FLUSH_BATCH_SIZE = 20
+    # ...or once the oldest queued row has waited this many seconds
+    FLUSH_INTERVAL = 5.0
+    MAX_RETRIES = 5
+
+    # Local map of Discord message ID -> sheet row, rebuilt from column G if missing
+    ROW_INDEX_PATH = os.getenv('SHEETS_ROW_INDEX_PATH', 'sheets_row_index.json')
+
+    def __init__(self, credentials_json, spreadsheet_id, initialize=True, service=None):
+        # An already-built Sheets service (e.g. a local stand-in) can be passed instead of credentials
+        if service is None:
+            # Load credentials from the JSON string
+            creds_dict = json.loads(credentials_json)
+            credentials = Credentials.from_service_account_info(
+                creds_dict,
+                scopes=['https://www.googleapis.com/auth/spreadsheets']
+            )
 
-        # Create Google Sheets service
-        self.service = build('sheets', 'v4', credentials=credentials)
+            # Create Google Sheets service
+            service = build('sheets', 'v4', credentials=credentials)
+        self.service = service
         self.spreadsheet_id = spreadsheet_id
 
+        # Write-behind queue state
+        self._pending_rows = []
+        self._wakeup = None
+        self._worker = None
+        self._flush_lock = None
+        self._closing = False
+
+        # Message ID -> row index, loaded lazily on the first feedback click
+        self.row_index = {}
+        self._row_index_loaded = False
+        self._inflight_ids = set()
+
         # Initialize the spreadsheet with headers if needed
-        self.initialize_sheet()
+        if initialize:
+            self.initialize_sheet()
 
     def initialize_sheet(self):
         """Initialize the spreadsheet with headers if it's empty"""
         headers = [
             ['Date', 'Question Asked', 'Answer Provided', 'Feedback Given', 
-             'Suggested Improvements', 'Status']
+             'Suggested Improvements', 'Status', 'Message ID']
         ]
 
         # Check if headers exist
         result = self.service.spreadsheets().values().get(
             spreadsheetId=self.spreadsheet_id,
-            range='Sheet1!A1:F1'
+            range='Sheet1!A1:G1'
         ).execute()
 
-        # If no headers, add them
-        if 'values' not in result:
+        # If no headers (or only the older six), add them
+        if 'values' not in result or len(result['values'][0]) < len(headers[0]):
             self.service.spreadsheets().values().update(
                 spreadsheetId=self.spreadsheet_id,
                 range='Sheet1!A1',
@@ -88,52 +278,192 @@ class GoogleSheetsLogger:
                 body={'values': headers}
             ).execute()
 
-    def log_interaction(self, question, answer, feedback="", improvements="", status="New"):
-        """Log a new interaction to the spreadsheet"""
+    def log_interaction(self, question, answer, feedback="", improvements="", status="New", message_id=None):
+        """Queue a new interaction for the spreadsheet; it is written by a background worker
+
+        `message_id` is the Discord message holding the answer, used to find
+        the row again when feedback is given.
+        """
         # Get current time in desired timezone (e.g., Singapore)
         sg_tz = pytz.timezone('Asia/Singapore')
         current_time = datetime.now(sg_tz).strftime('%Y-%m-%d %H:%M:%S')
 
         # Prepare the row data
-        row_data = [[
+        self._pending_rows.append([
             current_time,
             question,
             answer,
             feedback,
             improvements,
-            status
-        ]]
+            status,
+            str(message_id) if message_id else ""
+        ])
+
+        self._ensure_worker()
+        if len(self._pending_rows) >= self.FLUSH_BATCH_SIZE:
+            self._wakeup.set()
+
+    def _ensure_worker(self):
+        if self._worker is None or self._worker.done():
+            self._wakeup = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            self._worker = asyncio.create_task(self._run_worker())
+
+    async def _run_worker(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Append every queued row in a single API call, retrying with backoff"""
+        if self._flush_lock is None:
+            return
+        async with self._flush_lock:
+            if not self._pending_rows:
+                return
+            rows, self._pending_rows = self._pending_rows, []
+            self._inflight_ids = {row[6] for row in rows if row[6]}
+            try:
+                await self._append_with_retries(rows)
+            finally:
+                self._inflight_ids = set()
 
-        # Append the row to the spreadsheet
-        self.service.spreadsheets().values().append(
+    async def _append_with_retries(self, rows):
+        for attempt in range(self.MAX_RETRIES):
+            try:
+                with metrics.timer('kb_bot_stage_duration_seconds', pipeline='sheets', stage='append'):
+                    result = await asyncio.to_thread(self._append_rows, rows)
+            except Exception as e:
+                metrics.inc('kb_bot_sheets_rows_total', len(rows), outcome='retried')
+                delay = min(60, 2 ** attempt) * (0.5 + random.random())
+                print(f"Error logging to Google Sheets (attempt {attempt + 1}/{self.MAX_RETRIES}): {str(e)}")
+                await asyncio.sleep(delay)
+                continue
+
+            print(f"Logged {len(rows)} interaction(s) to Google Sheets")
+            metrics.inc('kb_bot_sheets_rows_total', len(rows), outcome='written')
+            await self._index_appended_rows(result, rows)
+            return
+
+        # Keep the rows for the next flush rather than dropping them
+        self._pending_rows = rows + self._pending_rows
+
+    def _append_rows(self, rows):
+        # Append the rows to the spreadsheet
+        return self.service.spreadsheets().values().append(
             spreadsheetId=self.spreadsheet_id,
-            range='Sheet1!A:F',
+            range='Sheet1!A:G',
             valueInputOption='RAW',
             insertDataOption='INSERT_ROWS',
-            body={'values': row_data}
+            body={'values': rows}
         ).execute()
 
-    def update_feedback(self, question, feedback, status="Reviewed"):
-        """Update the feedback and status for a specific question"""
-        # Search for the question
+    async def close(self):
+        """Stop the background worker and flush anything still queued"""
+        self._closing = True
+        if self._worker is not None and not self._worker.done():
+            self._wakeup.set()
+            await self._worker
+        await self.flush()
+        if self._pending_rows:
+            print(f"⚠️ {len(self._pending_rows)} interaction(s) could not be logged to Google Sheets")
+
+    async def _index_appended_rows(self, result, rows):
+        """Record the sheet row of each appended interaction from the append response"""
+        updated_range = result.get('updates', {}).get('updatedRange', '') if result else ''
+        match = re.search(r'![A-Z]+(\d+)', updated_range)
+        if not match:
+            return
+
+        # Merge into the persisted index rather than overwriting it with this session's rows
+        await self._ensure_row_index()
+        first_row = int(match.group(1))
+        for offset, row in enumerate(rows):
+            if row[6]:
+                self.row_index[row[6]] = first_row + offset
+        await asyncio.to_thread(self._save_row_index, dict(self.row_index))
+
+    async def _ensure_row_index(self):
+        """Load the persisted row index (or rebuild it) once, keeping rows indexed since startup"""
+        if not self._row_index_loaded:
+            loaded = await asyncio.to_thread(self._load_row_index)
+            loaded.update(self.row_index)
+            self.row_index = loaded
+            self._row_index_loaded = True
+
+    def _save_row_index(self, row_index):
+        try:
+            tmp_path = self.ROW_INDEX_PATH + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(row_index, f)
+            os.replace(tmp_path, self.ROW_INDEX_PATH)
+        except Exception as e:
+            print(f"Error saving sheet row index: {str(e)}")
+
+    def _load_row_index(self):
+        """Read the persisted row index, or rebuild it from the Message ID column"""
+        try:
+            with open(self.ROW_INDEX_PATH) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Error reading sheet row index, rebuilding: {str(e)}")
+
+        print("Rebuilding sheet row index from the Message ID column...")
         result = self.service.spreadsheets().values().get(
             spreadsheetId=self.spreadsheet_id,
-            range='Sheet1!A:F'
+            range='Sheet1!G:G'
         ).execute()
 
-        if 'values' in result:
-            values = result['values']
-            # Skip header row
-            for i, row in enumerate(values[1:], start=2):
-                if len(row) > 1 and row[1] == question:
-                    # Update feedback and status
+        row_index = {}
+        # Skip header row
+        for i, row in enumerate(result.get('values', [])[1:], start=2):
+            if row and row[0]:
+                row_index[row[0]] = i
+        self._save_row_index(row_index)
+        return row_index
+
+    async def update_feedback(self, message_id, feedback, status="Reviewed"):
+        """Update the feedback and status for the interaction answered by a Discord message"""
+        message_id = str(message_id)
+
+        if message_id in self._inflight_ids:
+            # Wait for the in-progress append so the row number is known
+            async with self._flush_lock:
+                pass
+
+        # The row may still be waiting in the write-behind queue
+        for row in self._pending_rows:
+            if row[6] == message_id:
+                row[3] = feedback
+                row[4] = ""
+                row[5] = status
+                return
+
+        await self._ensure_row_index()
+        row_number = self.row_index.get(message_id)
+        if row_number is None:
+            print(f"⚠️ No sheet row found for message {message_id}")
+            return
+
+        # Update feedback and status
+        try:
+            with metrics.timer('kb_bot_stage_duration_seconds', pipeline='sheets', stage='feedback_update'):
+                await asyncio.to_thread(
                     self.service.spreadsheets().values().update(
                         spreadsheetId=self.spreadsheet_id,
-                        range=f'Sheet1!D{i}:F{i}',
+                        range=f'Sheet1!D{row_number}:F{row_number}',
                         valueInputOption='RAW',
                         body={'values': [[feedback, "", status]]}
-                    ).execute()
-                    break
+                    ).execute
+                )
+        except Exception as e:
+            print(f"Error updating feedback for message {message_id}: {str(e)}")
 
 
 
@@ -149,6 +479,1614 @@ class FeedbackView(View):
         self.add_item(Button(style=ButtonStyle.blurple, custom_id="can_improve", label="Can Be Improved", emoji="📝"))
 
 
+class FreshdeskRateLimiter:
+    """Caps in-flight Freshdesk requests and adapts the cap to X-Ratelimit-Remaining"""
+
+    # Keep this many requests of rate-limit budget in reserve per concurrent slot
+    BUDGET_PER_SLOT = 10
+
+    def __init__(self, max_concurrency):
+        self.max_concurrency = max(1, max_concurrency)
+        self.concurrency = self.max_concurrency
+        self.in_flight = 0
+        self.request_count = 0
+        self.rate_limit_remaining = None
+        self._condition = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < self.concurrency)
+            self.in_flight += 1
+            self.request_count += 1
+        metrics.inc('kb_bot_freshdesk_requests_total')
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def update(self, headers):
+        """Shrink or grow the concurrency cap based on the remaining rate-limit budget"""
+        remaining = headers.get('X-Ratelimit-Remaining')
+        if remaining is None:
+            return
+        try:
+            self.rate_limit_remaining = int(remaining)
+        except ValueError:
+            return
+        metrics.set('kb_bot_freshdesk_rate_limit_remaining', self.rate_limit_remaining)
+
+        concurrency = max(1, min(self.max_concurrency, self.rate_limit_remaining // self.BUDGET_PER_SLOT))
+        if concurrency != self.concurrency:
+            print(f"  ⚖️ Rate limit remaining {self.rate_limit_remaining}, "
+                  f"adjusting concurrency {self.concurrency} -> {concurrency}")
+            self.concurrency = concurrency
+
+
+class FreshdeskClient:
+    """Long-lived Freshdesk API client shared by the KB loader, webhooks and diagnostics
+
+    - One aiohttp session with a keep-alive connection pool sized to the
+      concurrency limit, created on first use
+    - Every request goes through a FreshdeskRateLimiter, so the account-wide
+      X-Ratelimit-Remaining budget is tracked in one place
+    - 429s, 5xx responses, timeouts and connection errors are retried with
+      jittered exponential backoff; a 429's Retry-After pauses all requests
+    - Conditional GETs revalidate cached responses with If-None-Match /
+      If-Modified-Since, and a 304 is answered from the cache. Only the small
+      listing endpoints use them: article details are large, and the
+      incremental crawl already skips fetching the unchanged ones
+    """
+
+    MAX_RETRIES = int(os.getenv('FRESHDESK_MAX_RETRIES', '5'))
+    BACKOFF_BASE = 0.5
+    BACKOFF_MAX = 30.0
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+    TIMEOUT = 30
+    KEEPALIVE_TIMEOUT = 60
+    # Listing responses kept for conditional requests (only those that came with an ETag or Last-Modified)
+    RESPONSE_CACHE_SIZE = int(os.getenv('FRESHDESK_RESPONSE_CACHE_SIZE', '5000'))
+
+    def __init__(self, api_key, max_concurrency):
+        auth = base64.b64encode(f"{api_key}:X".encode('ascii')).decode('ascii')
+        self.headers = {
+            'Content-Type': 'application/json',
+            'Authorization': f'Basic {auth}'
+        }
+        self.max_concurrency = max(1, max_concurrency)
+        self.limiter = FreshdeskRateLimiter(self.max_concurrency)
+        self.responses = OrderedDict()  # url -> (ETag, Last-Modified, JSON body)
+        self.revalidated = 0
+        self.not_modified = 0
+        self.retries = 0
+        self.failures = 0  # requests that ran out of retries
+        self._session = None
+        self._resume_at = 0.0
+
+    def session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_concurrency, keepalive_timeout=self.KEEPALIVE_TIMEOUT, ttl_dns_cache=300
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector, headers=self.headers, timeout=aiohttp.ClientTimeout(total=self.TIMEOUT)
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    @staticmethod
+    def parse_retry_after(value):
+        """Seconds to wait from a Retry-After header given in seconds or as an HTTP date"""
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+
+    def retry_delay(self, attempt, retry_after=None):
+        """Full-jitter exponential backoff, never shorter than the server's Retry-After"""
+        delay = random.uniform(0, min(self.BACKOFF_MAX, self.BACKOFF_BASE * 2 ** attempt))
+        return max(delay, retry_after or 0.0)
+
+    def _remember(self, url, headers, body):
+        etag, last_modified = headers.get('ETag'), headers.get('Last-Modified')
+        if not etag and not last_modified:
+            return
+        self.responses[url] = (etag, last_modified, body)
+        self.responses.move_to_end(url)
+        while len(self.responses) > self.RESPONSE_CACHE_SIZE:
+            self.responses.popitem(last=False)
+
+    async def request(self, method, url, json=None, conditional=False):
+        """Send a request, retrying throttled and failed attempts
+
+        Returns (status, JSON body); the body is None unless the status is 200.
+        With conditional=True the response is cached for revalidation, and a
+        cached one is revalidated: a 304 returns (200, cached body). The status
+        is None if no attempt got a response.
+        """
+        cached = self.responses.get(url) if conditional else None
+        headers = {}
+        if cached is not None:
+            etag, last_modified, _ = cached
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+
+        status = None
+        for attempt in range(self.MAX_RETRIES + 1):
+            pause = self._resume_at - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+
+            retry_after = None
+            try:
+                async with self.limiter:
+                    async with self.session().request(method, url, json=json, headers=headers) as response:
+                        self.limiter.update(response.headers)
+                        status = response.status
+                        if cached is not None:
+                            self.revalidated += 1
+                        if status == 304 and cached is not None:
+                            self.not_modified += 1
+                            self.responses.move_to_end(url)
+                            return 200, cached[2]
+                        if status == 200:
+                            body = await response.json()
+                            if conditional:
+                                self._remember(url, response.headers, body)
+                            return status, body
+                        if status not in self.RETRY_STATUSES:
+                            if status == 401:
+                                print("Authentication failed. Please check your Freshdesk API key.")
+                            return status, None
+                        retry_after = self.parse_retry_after(response.headers.get('Retry-After'))
+                        if status == 429 and retry_after is not None:
+                            # The limit is per account, so every request waits it out, not just this one
+                            self._resume_at = max(self._resume_at, time.monotonic() + retry_after)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"Error accessing {url}: {str(e) or type(e).__name__}")
+                status = None
+
+            if attempt == self.MAX_RETRIES:
+                break
+            delay = self.retry_delay(attempt, retry_after)
+            self.retries += 1
+            metrics.inc('kb_bot_freshdesk_retries_total', reason=str(status) if status else 'network')
+            print(f"  🔁 {method} {url} {f'returned {status}' if status else 'failed'}, "
+                  f"retry {attempt + 1}/{self.MAX_RETRIES} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+        self.failures += 1
+        print(f"❌ {method} {url} failed after {self.MAX_RETRIES + 1} attempts (last status {status})")
+        return status, None
+
+    async def get_json(self, url, conditional=True):
+        """GET a JSON resource, revalidating any cached copy; None (after logging why) if it failed
+
+        Pass conditional=False for article details, which are not worth keeping in memory.
+        """
+        status, body = await self.request('GET', url, conditional=conditional)
+        if status not in (200, 401):
+            print(f"Error: Status {status} for URL {url}")
+        return body
+
+
+class EmbeddingStore:
+    """Persistent embedding cache keyed by a hash of the model name and the exact embedding text
+
+    Vectors are kept in a float32 .npy file (memory-mapped on load) next to a JSON
+    index of content hashes. A store written by a different model is discarded.
+    """
+
+    def __init__(self, directory, model_name):
+        self.directory = directory
+        self.model_name = model_name
+        self.vectors_path = os.path.join(directory, 'embeddings.npy')
+        self.index_path = os.path.join(directory, 'index.json')
+        self.rows = {}
+        self.vectors = None
+        self.hits = 0
+        self.misses = 0
+        self.load()
+
+    def key(self, text):
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode('utf-8')).hexdigest()
+
+    def load(self):
+        """Load the index and memory-map the vectors, dropping them if they belong to another model"""
+        try:
+            with open(self.index_path) as f:
+                index = json.load(f)
+            if index.get('model') != self.model_name:
+                print(f"Embedding store was built with {index.get('model')}, invalidating for {self.model_name}")
+                return
+            vectors = np.load(self.vectors_path, mmap_mode='r')
+            if len(vectors) != len(index['hashes']):
+                print("Embedding store index and vectors are out of sync, ignoring store")
+                return
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print(f"Error loading embedding store: {str(e)}")
+            return
+
+        self.rows = {key: row for row, key in enumerate(index['hashes'])}
+        self.vectors = vectors
+        print(f"Loaded {len(self.rows)} stored embeddings from {self.directory}")
+
+    def save(self, keys, vectors):
+        """Atomically replace the on-disk store with the given keys and vectors"""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_vectors = self.vectors_path + '.tmp.npy'
+            tmp_index = self.index_path + '.tmp'
+            np.save(tmp_vectors, vectors)
+            with open(tmp_index, 'w') as f:
+                json.dump({'model': self.model_name, 'dim': int(vectors.shape[1]), 'hashes': keys}, f)
+            os.replace(tmp_vectors, self.vectors_path)
+            os.replace(tmp_index, self.index_path)
+        except Exception as e:
+            print(f"Error saving embedding store: {str(e)}")
+
+    def encode(self, texts, encode_fn):
+        """Return embeddings for texts, encoding only the ones not already stored"""
+        keys = [self.key(text) for text in texts]
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in self.rows and key not in missing:
+                missing[key] = text
+
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        print(f"Embedding store: {len(texts) - len(missing)} hits, {len(missing)} to encode")
+        if missing:
+            encoded = np.asarray(encode_fn(list(missing.values())), dtype=np.float32)
+            old_keys = list(self.rows)
+            old_vectors = np.asarray(self.vectors, dtype=np.float32) if self.vectors is not None else encoded[:0]
+            all_keys = old_keys + list(missing)
+            all_vectors = np.ascontiguousarray(np.concatenate([old_vectors, encoded]))
+            self.rows = {key: row for row, key in enumerate(all_keys)}
+            self.vectors = all_vectors
+            self.save(all_keys, all_vectors)
+
+        return np.asarray(self.vectors[[self.rows[key] for key in keys]], dtype=np.float32)
+
+    def prune(self, texts):
+        """Drop stored embeddings that no longer correspond to any of the given texts"""
+        keep = {self.key(text) for text in texts}
+        if self.vectors is None or keep.issuperset(self.rows):
+            return
+        keys = [key for key in self.rows if key in keep]
+        vectors = np.ascontiguousarray(np.asarray(self.vectors[[self.rows[key] for key in keys]], dtype=np.float32))
+        self.rows = {key: row for row, key in enumerate(keys)}
+        self.vectors = vectors
+        self.save(keys, vectors)
+
+
+class KBSnapshot:
+    """Versioned on-disk copy of the article store, its passages and the normalised embedding matrix
+
+    Each save writes generation-stamped kb-<n>.json (the ArticleStore columns
+    and passage spans) and embeddings-<n>.npy files, then atomically replaces
+    meta.json to point at them, so a crash mid-save leaves the previous
+    snapshot in place. Article bodies stay in the store's text blob, which
+    lives in the same directory and is only ever appended to, so the snapshot
+    just records its name. The matrix and the blob are memory-mapped on load.
+    A snapshot from another format version or embedding model is ignored.
+    """
+
+    FORMAT_VERSION = 3
+
+    def __init__(self, directory, model_name):
+        self.directory = directory
+        self.model_name = model_name
+        self.meta_path = os.path.join(directory, 'meta.json')
+
+    def _write_meta(self, meta):
+        tmp_meta = self.meta_path + '.tmp'
+        with open(tmp_meta, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_meta, self.meta_path)
+
+    def _read_meta(self):
+        with open(self.meta_path) as f:
+            return json.load(f)
+
+    def save(self, kb):
+        """Write a new snapshot generation of a KBIndex and return its metadata, or None if it could not be saved"""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            generation = str(time.time_ns())
+            kb_name, matrix_name = f"kb-{generation}.json", f"embeddings-{generation}.npy"
+            columns = kb.articles.to_columns()
+
+            tmp_kb = os.path.join(self.directory, kb_name + '.tmp')
+            with open(tmp_kb, 'w') as f:
+                json.dump({
+                    'articles': columns,
+                    'passage_positions': kb.passage_positions.tolist(),
+                    'passage_spans': kb.passage_spans.ravel().tolist(),
+                }, f)
+            os.replace(tmp_kb, os.path.join(self.directory, kb_name))
+
+            tmp_matrix = os.path.join(self.directory, f"embeddings-{generation}.tmp.npy")
+            np.save(tmp_matrix, np.ascontiguousarray(kb.vectors, dtype=np.float32))
+            os.replace(tmp_matrix, os.path.join(self.directory, matrix_name))
+
+            now = time.time()
+            meta = {
+                'version': self.FORMAT_VERSION,
+                'model': self.model_name,
+                'generation': generation,
+                'kb': kb_name,
+                'matrix': matrix_name,
+                'bodies': columns['blob'],
+                'articles': len(kb),
+                'passages': kb.passage_count,
+                'created': now,
+                'refreshed': now,
+            }
+            self._write_meta(meta)
+        except Exception as e:
+            print(f"Error saving KB snapshot: {str(e)}")
+            return None
+
+        # Older generations are unreferenced now; a memory-mapped one stays readable until unmapped
+        for name in os.listdir(self.directory):
+            if name.startswith(('kb-', 'embeddings-', 'bodies-')) and name not in (kb_name, matrix_name, columns['blob']):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+        return meta
+
+    def mark_fresh(self):
+        """Record that the current snapshot was just confirmed up to date; returns the updated metadata"""
+        try:
+            meta = self._read_meta()
+            meta['refreshed'] = time.time()
+            self._write_meta(meta)
+            return meta
+        except Exception as e:
+            print(f"Error updating KB snapshot: {str(e)}")
+            return None
+
+    def load(self):
+        """Return (ArticleStore, passage positions, passage spans, memory-mapped vectors, metadata) from the current snapshot, or None"""
+        try:
+            meta = self._read_meta()
+            if meta.get('version') != self.FORMAT_VERSION or meta.get('model') != self.model_name:
+                print(f"KB snapshot is version {meta.get('version')} for {meta.get('model')}, ignoring it")
+                return None
+            with open(os.path.join(self.directory, meta['kb'])) as f:
+                kb = json.load(f)
+            vectors = np.load(os.path.join(self.directory, meta['matrix']), mmap_mode='r')
+            store = ArticleStore.from_columns(kb['articles'], self.directory)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Error loading KB snapshot: {str(e)}")
+            return None
+
+        positions = np.asarray(kb['passage_positions'], dtype=np.int32)
+        spans = np.asarray(kb['passage_spans'], dtype=np.int64).reshape(-1, 2)
+        if len(vectors) != len(positions) or len(spans) != len(positions):
+            print("KB snapshot passages and vectors are out of sync, ignoring it")
+            return None
+        return store, positions, spans, vectors, meta
+
+
+class SentenceTransformerBackend:
+    """PyTorch embedding backend using sentence-transformers"""
+
+    suffix = ''
+
+    def __init__(self, model_name, threads):
+        # Heavy imports are deferred to here to keep process start fast
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        # Add timeout and device placement
+        os.environ['TOKENIZERS_PARALLELISM'] = 'false'
+        self.model = SentenceTransformer(model_name, device='cpu')
+        torch.set_num_threads(threads)  # Limit threads
+
+    def encode(self, texts):
+        return self.model.encode(texts)
+
+
+class OnnxEmbeddingBackend:
+    """int8-quantized ONNX Runtime embedding backend for CPU-only deployments
+
+    Reproduces the sentence-transformers pipeline for MiniLM (tokenize, mean-pool
+    the token embeddings, L2-normalise) so its vectors are interchangeable with
+    the PyTorch backend. The quantized model is exported into `model_dir` the
+    first time it is needed; that one-off step requires torch and
+    sentence-transformers, afterwards only onnxruntime and tokenizers are used.
+    """
+
+    suffix = ':onnx-int8'
+
+    def __init__(self, model_name, threads, model_dir):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        model_path = os.path.join(model_dir, 'model-int8.onnx')
+        config_path = os.path.join(model_dir, 'embedding_config.json')
+        if not os.path.exists(model_path) or not os.path.exists(config_path):
+            self.export(model_name, model_dir)
+
+        with open(config_path) as f:
+            config = json.load(f)
+        if config.get('model') != model_name:
+            raise ValueError(f"ONNX model in {model_dir} was exported from {config.get('model')}, not {model_name}")
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, 'tokenizer.json'))
+        self.tokenizer.enable_truncation(max_length=config['max_seq_length'])
+        self.tokenizer.enable_padding(pad_id=config['pad_token_id'], pad_token=config['pad_token'])
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    def encode(self, texts, batch_size=32):
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            encodings = self.tokenizer.encode_batch(list(texts[start:start + batch_size]))
+            attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+            feeds = {
+                'input_ids': np.array([e.ids for e in encodings], dtype=np.int64),
+                'attention_mask': attention_mask,
+                'token_type_ids': np.array([e.type_ids for e in encodings], dtype=np.int64),
+            }
+            token_embeddings = self.session.run(
+                None, {name: value for name, value in feeds.items() if name in self.input_names}
+            )[0]
+
+            # Mean pooling over real tokens, then L2 normalisation
+            mask = attention_mask[..., None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            batches.append(pooled.astype(np.float32))
+
+        if not batches:
+            return np.zeros((0, self.session.get_outputs()[0].shape[-1]), dtype=np.float32)
+        return np.concatenate(batches)
+
+    @staticmethod
+    def export(model_name, model_dir):
+        """Export a sentence-transformers model to ONNX and quantize its weights to int8"""
+        import torch
+        from sentence_transformers import SentenceTransformer
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        print(f"Exporting {model_name} to int8 ONNX in {model_dir}...")
+        os.makedirs(model_dir, exist_ok=True)
+        st_model = SentenceTransformer(model_name, device='cpu')
+        transformer = st_model[0].auto_model.eval()
+        tokenizer = st_model.tokenizer
+
+        sample = tokenizer(["Export sample sentence"], return_tensors='pt')
+        input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in sample]
+        fp32_path = os.path.join(model_dir, 'model.onnx')
+
+        class LastHiddenState(torch.nn.Module):
+            def __init__(self, model):
+                super().__init__()
+                self.model = model
+
+            def forward(self, *inputs):
+                return self.model(**dict(zip(input_names, inputs))).last_hidden_state
+
+        with torch.no_grad():
+            torch.onnx.export(
+                LastHiddenState(transformer),
+                tuple(sample[name] for name in input_names),
+                fp32_path,
+                input_names=input_names,
+                output_names=['token_embeddings'],
+                dynamic_axes={name: {0: 'batch', 1: 'sequence'} for name in input_names + ['token_embeddings']},
+                opset_version=17,
+                dynamo=False,
+            )
+
+        quantize_dynamic(fp32_path, os.path.join(model_dir, 'model-int8.onnx'), weight_type=QuantType.QInt8)
+        os.remove(fp32_path)
+
+        tokenizer.save_pretrained(model_dir)
+        with open(os.path.join(model_dir, 'embedding_config.json'), 'w') as f:
+            json.dump({
+                'model': model_name,
+                'max_seq_length': st_model.max_seq_length,
+                'pad_token': tokenizer.pad_token,
+                'pad_token_id': tokenizer.pad_token_id,
+            }, f)
+        print("ONNX export complete")
+
+
+EMBEDDING_BACKENDS = {
+    'torch': SentenceTransformerBackend,
+    'onnx': OnnxEmbeddingBackend,
+}
+
+
+class QueryEncoder:
+    """Encodes questions on a dedicated executor, coalescing near-simultaneous requests into one batch"""
+
+    def __init__(self, encode_fn, executor, window=0.005, max_batch_size=32):
+        self.encode_fn = encode_fn
+        self.executor = executor
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._pending = []
+        self._flush_handle = None
+
+    async def encode(self, text):
+        """Return the embedding for a single text once its batch has been encoded"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush)
+
+        return await future
+
+    async def encode_many(self, texts):
+        """Return embeddings for several texts, encoded together in as few batches as possible"""
+        loop = asyncio.get_running_loop()
+        futures = []
+        for text in texts:
+            future = loop.create_future()
+            self._pending.append((text, future))
+            futures.append(future)
+            if len(self._pending) >= self.max_batch_size:
+                self._flush()
+        self._flush()
+        return await asyncio.gather(*futures)
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._encode_batch(batch))
+
+    async def _encode_batch(self, batch):
+        loop = asyncio.get_running_loop()
+        try:
+            embeddings = await loop.run_in_executor(
+                self.executor, self.encode_fn, [text for text, _ in batch]
+            )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        if len(batch) > 1:
+            print(f"Encoded {len(batch)} questions in one batch")
+        for (_, future), embedding in zip(batch, embeddings):
+            if not future.done():
+                future.set_result(embedding)
+
+
+class StreamingReply:
+    """Posts a placeholder message and progressively edits it as answer tokens stream in
+
+    Edits are throttled to one per `interval` seconds to stay inside Discord's
+    message edit rate limits; only the latest text is ever sent.
+    """
+
+    # Discord rejects message content longer than this
+    MAX_LENGTH = 2000
+
+    def __init__(self, send, prefix, interval=1.0):
+        self.send = send
+        self.prefix = prefix
+        self.interval = interval
+        self.message = None
+        self._latest = None
+        self._last_edit = 0.0
+        self._edit_task = None
+
+    async def start(self, placeholder="⏳ Looking through the knowledge base..."):
+        self.message = await self.send(f"{self.prefix}{placeholder}")
+        self._last_edit = time.monotonic()
+        return self.message
+
+    async def update(self, text):
+        """Record the partial answer and schedule an edit if none is pending"""
+        self._latest = text
+        if self._edit_task is None or self._edit_task.done():
+            self._edit_task = asyncio.create_task(self._edit_latest())
+
+    async def _edit_latest(self):
+        delay = self.interval - (time.monotonic() - self._last_edit)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        content = f"{self.prefix}{self._latest} ▌"
+        if len(content) > self.MAX_LENGTH:
+            content = content[:self.MAX_LENGTH - 2] + " ▌"
+        try:
+            await self.message.edit(content=content)
+            metrics.inc('kb_bot_discord_edits_total')
+        except Exception as e:
+            print(f"Error editing streamed reply: {str(e)}")
+        self._last_edit = time.monotonic()
+
+    async def notify(self, text):
+        """Replace the placeholder with a status message right away"""
+        try:
+            await self.message.edit(content=f"{self.prefix}{text}")
+        except Exception as e:
+            print(f"Error editing streamed reply: {str(e)}")
+        self._last_edit = time.monotonic()
+
+    async def finish(self, text, view=None):
+        """Replace the placeholder with the final answer"""
+        if self._edit_task is not None and not self._edit_task.done():
+            self._edit_task.cancel()
+        content = f"{self.prefix}{text}"
+        if self.message is None:
+            self.message = await self.send(content, view=view)
+        else:
+            await self.message.edit(content=content, view=view)
+        return self.message
+
+
+class ExactSearchBackend:
+    """Brute-force inner-product search: one matrix-vector product plus a partial top-k selection"""
+
+    name = 'exact'
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def updated(self, vectors, source_rows):
+        return ExactSearchBackend(vectors)
+
+    def search(self, query, k):
+        scores = self.vectors @ query
+        k = min(k, len(scores))
+        if k < len(scores):
+            top = np.argpartition(scores, -k)[-k:]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(scores[top])[::-1]]
+        return top, scores[top]
+
+
+class HnswSearchBackend:
+    """Approximate nearest-neighbour search using an HNSW graph (needs the optional hnswlib package)"""
+
+    name = 'hnsw'
+
+    def __init__(self, vectors, m=16, ef_construction=200, ef_search=64):
+        import hnswlib
+
+        self.count = len(vectors)
+        self.ef_search = ef_search
+        self.index = hnswlib.Index(space='ip', dim=vectors.shape[1])
+        self.index.init_index(max_elements=max(1, self.count), ef_construction=ef_construction, M=m)
+        self.index.add_items(vectors, np.arange(self.count))
+        self.index.set_ef(ef_search)
+        # Graph labels stay fixed while updates renumber the rows
+        self.row_labels = np.arange(self.count)  # row -> label
+        self.label_rows = np.arange(self.count)  # label -> row, -1 once deleted
+
+    def updated(self, vectors, source_rows):
+        """Backend for `vectors`, whose rows come from this one's `source_rows` (-1 for new rows)
+
+        Works on a copy of the graph: labels of dropped rows are marked deleted
+        and only the new rows are inserted, instead of rebuilding it. This
+        backend is left untouched; deleted labels are reclaimed by the next full build.
+        """
+        backend = object.__new__(type(self))
+        backend.count = len(vectors)
+        backend.ef_search = self.ef_search
+        backend.index = pickle.loads(pickle.dumps(self.index))
+
+        source_rows = np.asarray(source_rows, dtype=np.int64)
+        kept = source_rows >= 0
+        row_labels = np.empty(len(source_rows), dtype=np.int64)
+        row_labels[kept] = self.row_labels[source_rows[kept]]
+        for label in np.setdiff1d(self.row_labels, row_labels[kept]):
+            backend.index.mark_deleted(int(label))
+
+        added = np.flatnonzero(~kept)
+        next_label = len(self.label_rows)
+        row_labels[added] = np.arange(next_label, next_label + len(added))
+        if len(added):
+            needed = next_label + len(added)
+            if needed > backend.index.get_max_elements():
+                backend.index.resize_index(max(needed, 2 * backend.index.get_max_elements()))
+            backend.index.add_items(vectors[added], row_labels[added])
+
+        backend.row_labels = row_labels
+        backend.label_rows = np.full(next_label + len(added), -1, dtype=np.int64)
+        backend.label_rows[row_labels] = np.arange(len(row_labels))
+        backend.index.set_ef(self.ef_search)
+        return backend
+
+    def search(self, query, k):
+        k = min(k, self.count)
+        if k > self.ef_search:
+            self.index.set_ef(k)
+        try:
+            labels, distances = self.index.knn_query(query, k=k)
+        finally:
+            if k > self.ef_search:
+                self.index.set_ef(self.ef_search)
+        # hnswlib reports inner-product distance as 1 - <a, b>
+        return self.label_rows[labels[0]], (1.0 - distances[0]).astype(np.float32)
+
+
+class VectorIndex:
+    """In-process cosine-similarity index over L2-normalised float32 embeddings
+
+    Embeddings are normalised once at build time, so a query is scored with a
+    single matrix-vector product. The 'auto' backend switches from exact search
+    to HNSW once the index reaches ANN_THRESHOLD vectors and hnswlib is installed.
+    """
+
+    BACKENDS = {
+        'exact': ExactSearchBackend,
+        'hnsw': HnswSearchBackend,
+    }
+
+    ANN_THRESHOLD = 20000
+
+    def __init__(self, embeddings, backend='auto', normalized=False):
+        if normalized:
+            # Already unit-length float32 rows, e.g. a memory-mapped snapshot: use them without copying
+            self.vectors = embeddings
+        else:
+            self.vectors = self.normalize(embeddings)
+
+        if backend == 'auto':
+            backend = 'hnsw' if len(self.vectors) >= self.ANN_THRESHOLD else 'exact'
+        try:
+            self.backend = self.BACKENDS[backend](self.vectors)
+        except ImportError as e:
+            print(f"Vector index backend '{backend}' unavailable ({str(e)}), using exact search")
+            self.backend = ExactSearchBackend(self.vectors)
+
+    @staticmethod
+    def normalize(embeddings):
+        """Contiguous float32 copy of the embeddings scaled to unit length"""
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return np.ascontiguousarray(vectors / norms)
+
+    def __len__(self):
+        return len(self.vectors)
+
+    @property
+    def nbytes(self):
+        return self.vectors.nbytes
+
+    def updated(self, vectors, source_rows):
+        """Index over normalised `vectors` whose rows come from this index's `source_rows` (-1 for new rows)
+
+        Keeps this index's backend and lets it reuse its work (an HNSW graph is
+        updated in a copy rather than rebuilt); this index is left untouched.
+        """
+        index = object.__new__(VectorIndex)
+        index.vectors = vectors
+        index.backend = self.backend.updated(vectors, source_rows)
+        return index
+
+    def search(self, query, k, rows=None):
+        """Return (indices, cosine scores) of the k nearest vectors, best first
+
+        With rows=(start, end) only that slice of the matrix is searched, exactly.
+        """
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+        if rows is None:
+            return self.backend.search(query, k)
+        start, end = rows
+        top, scores = ExactSearchBackend(self.vectors[start:end]).search(query, k)
+        return top + start, scores
+
+
+class BM25Index:
+    """Inverted index scoring documents with Okapi BM25
+
+    Documents can be added and removed one at a time, so an incremental KB
+    refresh only re-indexes the articles that changed; copy() gives it a
+    private copy to update while the original keeps serving. Compound tokens such as
+    product codes ("EP-1234") are indexed whole, joined ("ep1234") and by part.
+    """
+
+    K1 = 1.5
+    B = 0.75
+    TITLE_WEIGHT = 3  # title terms count as if they appeared this many times
+
+    TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+    STOP_WORDS = frozenset("""
+        a an and are as at be by can do does for from how i in is it me my of on or our
+        the this to we what when where which who why will with you your
+    """.split())
+
+    def __init__(self):
+        self.postings = defaultdict(dict)  # term -> {doc_id: term frequency}
+        self.doc_terms = {}  # doc_id -> Counter, kept so a document can be removed again
+        self.doc_lengths = {}
+        self.total_length = 0
+        self._owned = None  # terms whose posting lists a copy has made its own; None owns them all
+
+    def copy(self):
+        """Independent copy of the index; posting lists are shared until the copy first changes them"""
+        clone = BM25Index()
+        clone.postings = defaultdict(dict, self.postings)
+        clone.doc_terms = dict(self.doc_terms)
+        clone.doc_lengths = dict(self.doc_lengths)
+        clone.total_length = self.total_length
+        clone._owned = set()
+        return clone
+
+    def _writable_postings(self, term):
+        if self._owned is not None and term not in self._owned:
+            self.postings[term] = dict(self.postings.get(term, ()))
+            self._owned.add(term)
+        return self.postings[term]
+
+    @classmethod
+    def tokenize(cls, text):
+        tokens = []
+        for token in cls.TOKEN_PATTERN.findall((text or '').lower()):
+            parts = re.split(r'[-_./]', token)
+            if len(parts) > 1:
+                tokens.append(token)
+                tokens.append(''.join(parts))
+            tokens.extend(part for part in parts if part not in cls.STOP_WORDS)
+        return tokens
+
+    def __len__(self):
+        return len(self.doc_terms)
+
+    def __contains__(self, doc_id):
+        return doc_id in self.doc_terms
+
+    def add(self, doc_id, text, title=''):
+        """Index a document, replacing any previous version with the same id"""
+        self.remove(doc_id)
+        terms = Counter(self.tokenize(text))
+        for term in self.tokenize(title):
+            terms[term] += self.TITLE_WEIGHT
+
+        self.doc_terms[doc_id] = terms
+        self.doc_lengths[doc_id] = sum(terms.values())
+        self.total_length += self.doc_lengths[doc_id]
+        for term, frequency in terms.items():
+            self._writable_postings(term)[doc_id] = frequency
+
+    def remove(self, doc_id):
+        terms = self.doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        self.total_length -= self.doc_lengths.pop(doc_id)
+        for term in terms:
+            postings = self._writable_postings(term)
+            postings.pop(doc_id, None)
+            if not postings:
+                del self.postings[term]
+
+    def idf(self, term):
+        document_frequency = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.doc_terms) - document_frequency + 0.5) / (document_frequency + 0.5))
+
+    def reference_score(self, query):
+        """BM25 score of an average-length document containing each indexed query term once
+
+        Scores divided by this (and capped at 1) are comparable across queries,
+        unlike raw BM25 scores.
+        """
+        return sum(self.idf(term) for term in set(self.tokenize(query)) if term in self.postings)
+
+    def search(self, query, k, docs=None):
+        """Return up to k (doc_id, score) pairs, best first, optionally only among the ids in `docs`"""
+        if not self.doc_terms:
+            return []
+
+        average_length = self.total_length / len(self.doc_terms) or 1.0
+        scores = defaultdict(float)
+        for term in set(self.tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf(term)
+            for doc_id, frequency in postings.items():
+                if docs is not None and doc_id not in docs:
+                    continue
+                norm = self.K1 * (1 - self.B + self.B * self.doc_lengths[doc_id] / average_length)
+                scores[doc_id] += idf * frequency * (self.K1 + 1) / (frequency + norm)
+
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+
+class ArticleView(Mapping):
+    """Read-only dict-like view of one article in an ArticleStore
+
+    Keeps the article-dict access the rest of the bot uses (article['title'],
+    article.get('url'), dict(article)) working; the description is read from
+    the store's text blob only when asked for.
+    """
+
+    __slots__ = ('store', 'position')
+
+    def __init__(self, store, position):
+        self.store = store
+        self.position = position
+
+    def __getitem__(self, key):
+        return self.store.field(self.position, key)
+
+    def __iter__(self):
+        return iter(ArticleStore.FIELDS)
+
+    def __len__(self):
+        return len(ArticleStore.FIELDS)
+
+    def __repr__(self):
+        return f"<ArticleView {self['id']} {self['title']!r}>"
+
+
+class ArticleStore(Sequence):
+    """Compact columnar storage for knowledge base articles
+
+    Per-article fields live in parallel lists and arrays, category and folder
+    names are interned into small tables, URLs are derived from the id, and
+    article bodies (whitespace-normalised UTF-8) sit in an append-only text
+    blob on disk that is memory-mapped and only read when an article's text is
+    needed. Indexing returns ArticleViews. A store is never changed once built;
+    build() makes a successor that keeps using the blob, appending only the
+    bodies of new and edited articles, until too little of it is still live.
+    """
+
+    FIELDS = ('title', 'description', 'url', 'category', 'folder', 'folder_id',
+              'id', 'status', 'created_at', 'updated_at')
+
+    # Start a fresh blob once less than this share of the current one is still referenced
+    MIN_LIVE_RATIO = 0.5
+
+    def __init__(self, blob_path=None, url_prefix=''):
+        self.blob_path = blob_path
+        self.blob_size = 0  # bytes of the blob this store references
+        self.url_prefix = url_prefix
+        self.ids = []
+        self.titles = []
+        self.created = []
+        self.updated = []
+        self.statuses = array('h')
+        self.category_codes = array('I')
+        self.folder_codes = array('I')
+        self.body_offsets = array('q')  # start, end byte offsets into the blob, two per article
+        self.categories = []  # name by category code
+        self.folders = []  # (folder id, folder name) by folder code
+        self.positions = {}  # article id -> position
+        self._category_lookup = {}
+        self._folder_lookup = {}
+        self._blob = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [ArticleView(self, i) for i in range(*position.indices(len(self)))]
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError('article position out of range')
+        return ArticleView(self, position)
+
+    _GETTERS = {
+        'title': lambda store, position: store.titles[position],
+        'description': lambda store, position: store.body(position),
+        'url': lambda store, position: store.url_prefix + store.ids[position],
+        'category': lambda store, position: store.categories[store.category_codes[position]],
+        'folder': lambda store, position: store.folders[store.folder_codes[position]][1],
+        'folder_id': lambda store, position: store.folders[store.folder_codes[position]][0],
+        'id': lambda store, position: store.ids[position],
+        'status': lambda store, position: store.statuses[position],
+        'created_at': lambda store, position: store.created[position],
+        'updated_at': lambda store, position: store.updated[position],
+    }
+
+    def field(self, position, key):
+        try:
+            getter = self._GETTERS[key]
+        except KeyError:
+            raise KeyError(key) from None
+        return getter(self, position)
+
+    def folder_names(self, folder_id):
+        """(category, folder) names of a folder some stored article belongs to, or None"""
+        for code, (stored_id, folder_name) in enumerate(self.folders):
+            if stored_id == folder_id:
+                position = self.folder_codes.index(code)
+                return self.categories[self.category_codes[position]], folder_name
+        return None
+
+    @property
+    def live_bytes(self):
+        return sum(self.body_offsets[1::2]) - sum(self.body_offsets[0::2])
+
+    def body_bytes(self, position, start=0, end=None):
+        """UTF-8 bytes of an article's body, or of the [start, end) byte range within it"""
+        body_start, body_end = self.body_offsets[2 * position], self.body_offsets[2 * position + 1]
+        end = body_end if end is None else body_start + end
+        start = body_start + start
+        if start >= end:
+            return b''
+        return self._blob[start:end]
+
+    def body(self, position):
+        return self.body_bytes(position).decode('utf-8')
+
+    def _map_blob(self):
+        if self.blob_size:
+            with open(self.blob_path, 'rb') as f:
+                self._blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _intern(self, table, lookup, value):
+        code = lookup.get(value)
+        if code is None:
+            code = lookup[value] = len(table)
+            table.append(value)
+        return code
+
+    def _append(self, article, start, end):
+        folder_id = article.get('folder_id')
+        self.positions[str(article['id'])] = len(self.ids)
+        self.ids.append(str(article['id']))
+        self.titles.append(article.get('title') or '')
+        self.created.append(article.get('created_at'))
+        self.updated.append(article.get('updated_at'))
+        self.statuses.append(int(article.get('status') or 0))
+        self.category_codes.append(self._intern(self.categories, self._category_lookup, article['category']))
+        self.folder_codes.append(self._intern(
+            self.folders, self._folder_lookup, (str(folder_id) if folder_id else None, article['folder'])
+        ))
+        self.body_offsets.extend((start, end))
+
+    @classmethod
+    def build(cls, directory, url_prefix, articles, base=None):
+        """Store articles given as dicts or ArticleViews, returning a new ArticleStore
+
+        Views whose body is already in base's blob keep pointing at it, and
+        every other body is appended to that blob, unless less than
+        MIN_LIVE_RATIO of it is still live, in which case all bodies go to a
+        fresh blob. Blocking, so run it in a thread.
+        """
+        reuse = (
+            base is not None and base.blob_path is not None and base.blob_size
+            and os.path.exists(base.blob_path)
+            and base.live_bytes >= cls.MIN_LIVE_RATIO * base.blob_size
+        )
+        os.makedirs(directory, exist_ok=True)
+        blob_path = base.blob_path if reuse else os.path.join(directory, f"bodies-{time.time_ns()}.txt")
+
+        store = cls(blob_path, url_prefix)
+        with open(blob_path, 'ab') as blob:
+            offset = blob.seek(0, os.SEEK_END)
+            for article in articles:
+                if reuse and isinstance(article, ArticleView) and article.store.blob_path == blob_path:
+                    position = article.position
+                    start, end = article.store.body_offsets[2 * position], article.store.body_offsets[2 * position + 1]
+                else:
+                    body = ' '.join((article.get('description') or '').split()).encode('utf-8')
+                    blob.write(body)
+                    start, end = offset, offset + len(body)
+                    offset = end
+                store._append(article, start, end)
+        store.blob_size = offset
+        store._map_blob()
+        return store
+
+    @staticmethod
+    def group_by_scope(articles):
+        """Order articles so each category, and each folder within it, is contiguous
+
+        Categories and folders keep the order they first appear in, as do the
+        articles within a folder. KBIndex relies on this for its scope partitions.
+        """
+        groups = {}
+        for article in articles:
+            groups.setdefault(article['category'], {}).setdefault(article['folder'], []).append(article)
+        return [article for folders in groups.values() for folder in folders.values() for article in folder]
+
+    def to_columns(self):
+        """JSON-serialisable columns; the blob is referenced by file name"""
+        return {
+            'blob': os.path.basename(self.blob_path) if self.blob_path else None,
+            'blob_size': self.blob_size,
+            'url_prefix': self.url_prefix,
+            'ids': self.ids,
+            'titles': self.titles,
+            'created': self.created,
+            'updated': self.updated,
+            'statuses': self.statuses.tolist(),
+            'category_codes': self.category_codes.tolist(),
+            'folder_codes': self.folder_codes.tolist(),
+            'body_offsets': self.body_offsets.tolist(),
+            'categories': self.categories,
+            'folders': [list(folder) for folder in self.folders],
+        }
+
+    @classmethod
+    def from_columns(cls, columns, directory):
+        """Rebuild a store saved with to_columns() whose blob is in `directory`"""
+        blob_path = os.path.join(directory, columns['blob']) if columns['blob'] else None
+        if blob_path is not None and os.path.getsize(blob_path) < columns['blob_size']:
+            raise ValueError(f"{columns['blob']} is shorter than the {columns['blob_size']} bytes it should hold")
+        store = cls(blob_path, columns['url_prefix'])
+        store.blob_size = columns['blob_size']
+        store.ids = columns['ids']
+        store.titles = columns['titles']
+        store.created = columns['created']
+        store.updated = columns['updated']
+        store.statuses = array('h', columns['statuses'])
+        store.category_codes = array('I', columns['category_codes'])
+        store.folder_codes = array('I', columns['folder_codes'])
+        store.body_offsets = array('q', columns['body_offsets'])
+        store.categories = columns['categories']
+        store.folders = [tuple(folder) for folder in columns['folders']]
+        store.positions = {article_id: position for position, article_id in enumerate(store.ids)}
+        store._category_lookup = {name: code for code, name in enumerate(store.categories)}
+        store._folder_lookup = {folder: code for code, folder in enumerate(store.folders)}
+        store._map_blob()
+        return store
+
+
+class KBIndex:
+    """One immutable version of the searchable knowledge base
+
+    Bundles the ArticleStore, the passages (article position plus a byte span
+    within that article's body), the vector and BM25 indexes and the layout
+    linking them. Articles are stored grouped by category and folder (see
+    ArticleStore.group_by_scope), so every category and folder is one
+    partition: a contiguous range of article positions and of index rows that
+    a scoped search can slice. Loads build a new KBIndex off to the side and publish it by
+    replacing FreshdeskKBBot.kb in a single assignment; a question reads that
+    reference once and answers from the same version throughout, even if a
+    refresh publishes another one meanwhile.
+    """
+
+    def __init__(self, articles=None, passage_positions=(), passage_spans=(), index=None, lexical=None):
+        self.articles = articles if articles is not None else ArticleStore()
+        self.passage_positions = np.asarray(passage_positions, dtype=np.int32)  # one per index row
+        self.passage_spans = np.asarray(passage_spans, dtype=np.int64).reshape(-1, 2)
+        self.index = index
+        self.lexical = lexical
+        self.positions = self.articles.positions
+        self.passage_rows = {}
+        for row, position in enumerate(self.passage_positions.tolist()):
+            self.passage_rows.setdefault(position, []).append(row)
+        self.partitions = self.build_partitions()
+
+    def __len__(self):
+        return len(self.articles)
+
+    def build_partitions(self):
+        """Scope partitions keyed by lower-case 'category' and 'category/folder' name"""
+        store = self.articles
+        bounds = {}
+        for position, codes in enumerate(zip(store.category_codes, store.folder_codes)):
+            for key in ((codes[0], None), codes):
+                bounds[key] = (bounds.get(key, (position,))[0], position + 1)
+
+        partitions = {}
+        for (category_code, folder_code), (start, end) in bounds.items():
+            category = store.categories[category_code]
+            folder = store.folders[folder_code][1] if folder_code is not None else None
+            name = f"{category}/{folder}" if folder is not None else category
+            partitions[name.lower()] = {
+                'name': name,
+                'category': category,
+                'folder': folder,
+                'category_code': category_code,
+                'folder_code': folder_code,
+                'articles': (start, end),
+                'rows': (self.passage_rows[start][0], self.passage_rows[end - 1][-1] + 1),
+                'ids': None,
+            }
+        return partitions
+
+    def scope(self, name):
+        """Partition for a category, 'category/folder' or unambiguous folder name (any case), or None"""
+        key = re.sub(r'\s*/\s*', '/', ' '.join(str(name).split())).lower()
+        partition = self.partitions.get(key)
+        if partition is None:
+            matches = [p for p in self.partitions.values() if p['folder'] is not None and p['folder'].lower() == key]
+            partition = matches[0] if len(matches) == 1 else None
+        return partition
+
+    def scope_names(self):
+        """Every name scope() accepts, in its stored case"""
+        names = [partition['name'] for partition in self.partitions.values()]
+        return names + [partition['folder'] for partition in self.partitions.values() if partition['folder']]
+
+    def in_scope(self, scope, position):
+        store = self.articles
+        return store.category_codes[position] == scope['category_code'] and (
+            scope['folder_code'] is None or store.folder_codes[position] == scope['folder_code']
+        )
+
+    def scope_ids(self, scope):
+        """Ids of the articles in a partition, worked out on first use"""
+        if scope['ids'] is None:
+            start, end = scope['articles']
+            scope['ids'] = frozenset(
+                self.articles.ids[position] for position in range(start, end) if self.in_scope(scope, position)
+            )
+        return scope['ids']
+
+    @property
+    def passage_count(self):
+        return len(self.passage_positions)
+
+    def passage_text(self, row):
+        start, end = self.passage_spans[row]
+        return self.articles.body_bytes(int(self.passage_positions[row]), int(start), int(end)).decode('utf-8')
+
+    @property
+    def vectors(self):
+        return self.index.vectors if self.index is not None else None
+
+
+class LatencyStats:
+    """Rolling latency samples per named path, for console reporting"""
+
+    WINDOW = 1000
+
+    def __init__(self):
+        self.samples = defaultdict(lambda: deque(maxlen=self.WINDOW))
+
+    def record(self, path, seconds):
+        self.samples[path].append(seconds * 1000)
+
+    def summary(self, path):
+        samples = self.samples.get(path)
+        if not samples:
+            return f"{path}: no samples"
+        p50, p95 = np.percentile(samples, [50, 95])
+        return f"{path}: p50 {p50:.1f} ms, p95 {p95:.1f} ms over {len(samples)} queries"
+
+
+class TokenCounter:
+    """Counts tokens locally with tiktoken, estimating ~4 characters per token when it is unavailable
+
+    The encoding is loaded on first use so tiktoken never slows down startup.
+    """
+
+    CHARS_PER_TOKEN = 4
+    TOKENS_PER_MESSAGE = 4  # chat format overhead per message
+    TOKENS_PER_REPLY = 3  # every reply is primed with the assistant role
+
+    def __init__(self, model):
+        self.model = model
+        self._encoding = None
+        self._encoding_loaded = False
+
+    @property
+    def encoding(self):
+        if not self._encoding_loaded:
+            self._encoding_loaded = True
+            try:
+                import tiktoken
+                try:
+                    self._encoding = tiktoken.encoding_for_model(self.model)
+                except KeyError:
+                    self._encoding = tiktoken.get_encoding('cl100k_base')
+            except Exception as e:
+                print(f"tiktoken unavailable ({str(e)}), estimating token counts from text length")
+        return self._encoding
+
+    def count(self, text):
+        if self.encoding is None:
+            return -(-len(text) // self.CHARS_PER_TOKEN)
+        return len(self.encoding.encode(text))
+
+    def count_messages(self, messages):
+        return sum(self.count(message['content']) + self.TOKENS_PER_MESSAGE for message in messages) + self.TOKENS_PER_REPLY
+
+    def truncate(self, text, max_tokens):
+        """Return the longest prefix of text that fits in max_tokens"""
+        if max_tokens <= 0:
+            return ''
+        if self.encoding is None:
+            return text[:max_tokens * self.CHARS_PER_TOKEN]
+        tokens = self.encoding.encode(text)
+        return text if len(tokens) <= max_tokens else self.encoding.decode(tokens[:max_tokens])
+
+
+class SemanticAnswerCache:
+    """LRU/TTL cache of answers keyed by question embedding similarity
+
+    A lookup hits when a cached question's embedding has cosine similarity of at
+    least `threshold` with the new one and it was asked in the same scope.
+    Entries remember the articles they cite so they can be dropped when any of
+    those articles changes.
+    """
+
+    def __init__(self, threshold=0.92, max_entries=256, ttl=3600):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self._next_key = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _normalize(self, embedding):
+        embedding = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm > 0 else embedding
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.ttl
+        for key in [key for key, entry in self.entries.items() if entry['created'] < cutoff]:
+            del self.entries[key]
+
+    def get(self, embedding, scope=None):
+        """Return the cached entry for the most similar past question in `scope`, if it is similar enough"""
+        self._expire()
+        keys = [key for key, entry in self.entries.items() if entry['scope'] == scope]
+        if not keys:
+            self.misses += 1
+            return None
+
+        scores = np.stack([self.entries[key]['embedding'] for key in keys]) @ self._normalize(embedding)
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end(keys[best])
+        return self.entries[keys[best]]
+
+    def put(self, embedding, answer, articles, scope=None):
+        self.entries[self._next_key] = {
+            'embedding': self._normalize(embedding),
+            'scope': scope,
+            'answer': answer,
+            'articles': articles,
+            'article_ids': {article['id'] for article in articles},
+            'created': time.monotonic(),
+        }
+        self._next_key += 1
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, article_ids):
+        """Drop every cached answer that cites one of the given articles"""
+        article_ids = set(article_ids)
+        stale = [key for key, entry in self.entries.items() if entry['article_ids'] & article_ids]
+        for key in stale:
+            del self.entries[key]
+        return len(stale)
+
+
+class SingleFlight:
+    """Shares one in-flight call between concurrent callers that use the same key
+
+    The call runs as its own task, so a caller going away does not cancel it for
+    the others. Callers that join late are replayed the latest streamed update.
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self.shared = 0
+
+    def running(self, key):
+        return key in self.calls
+
+    async def run(self, key, fn, on_update=None):
+        """Await fn(on_update) once per key; concurrent callers with the same key share its result"""
+        call = self.calls.get(key)
+        if call is None:
+            call = {'listeners': [], 'latest': None}
+
+            async def broadcast(text):
+                call['latest'] = text
+                for listener in list(call['listeners']):
+                    try:
+                        await listener(text)
+                    except Exception as e:
+                        print(f"Error delivering streamed update: {str(e)}")
+
+            call['task'] = asyncio.ensure_future(fn(broadcast))
+            call['task'].add_done_callback(lambda _: self.calls.pop(key, None))
+            self.calls[key] = call
+        else:
+            self.shared += 1
+            print(f"🔗 Joining in-flight answer for: {key}")
+
+        if on_update is not None:
+            call['listeners'].append(on_update)
+            if call['latest'] is not None:
+                await on_update(call['latest'])
+
+        return await asyncio.shield(call['task'])
+
+
+class SchedulerBusy(Exception):
+    """Raised when a request arrives while the scheduler's queue is full"""
+
+
+class RequestScheduler:
+    """Runs at most `workers` requests at once and queues the rest
+
+    Queued requests are served by source priority (lower number first) and,
+    within a priority, channels take turns so one busy channel cannot starve
+    the others. Once `max_queue` requests are waiting, new ones are rejected
+    with SchedulerBusy instead of piling up. A source missing from
+    `priorities` gets the lowest configured priority.
+    """
+
+    def __init__(self, workers, max_queue, priorities):
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self.priorities = priorities
+        self.default_priority = max(priorities.values(), default=0)
+        self.running = 0
+        self.queued = 0
+        self.queues = {}  # priority -> OrderedDict of channel -> deque of waiting futures
+
+    @property
+    def full(self):
+        return self.queued >= self.max_queue
+
+    def dispatch_order(self):
+        """Waiting requests in the order they will be started"""
+        order = []
+        for priority in sorted(self.queues):
+            channels = list(self.queues[priority].values())
+            for depth in range(max((len(waiting) for waiting in channels), default=0)):
+                order.extend(waiting[depth] for waiting in channels if depth < len(waiting))
+        return order
+
+    async def submit(self, fn, source='human', channel=None, on_queued=None):
+        """Await fn() once a worker is free
+
+        If the request has to wait, `on_queued` is awaited with its 1-based
+        position in the queue first.
+        """
+        if self.running < self.workers and not self.queued:
+            self.running += 1
+            return await self._run(fn)
+
+        if self.full:
+            raise SchedulerBusy(f"{self.queued} requests already queued")
+
+        ready = asyncio.get_running_loop().create_future()
+        channels = self.queues.setdefault(self.priorities.get(source, self.default_priority), OrderedDict())
+        channels.setdefault(channel, deque()).append(ready)
+        self.queued += 1
+        position = next(i for i, waiting in enumerate(self.dispatch_order(), 1) if waiting is ready)
+
+        queued_at = time.perf_counter()
+        try:
+            if on_queued is not None:
+                await on_queued(position)
+            await ready
+        except BaseException:
+            if ready.done() and not ready.cancelled():
+                self._release()  # a worker was already handed to this request
+            else:
+                self._discard(ready)
+            raise
+        metrics.observe('kb_bot_stage_duration_seconds', time.perf_counter() - queued_at,
+                        pipeline='answer', stage='queue_wait')
+        return await self._run(fn)
+
+    async def _run(self, fn):
+        try:
+            return await fn()
+        finally:
+            self._release()
+
+    def _release(self):
+        """Hand the finished request's worker to the next waiting request, or free it"""
+        while self.queues:
+            priority = min(self.queues)
+            channels = self.queues[priority]
+            channel, waiting = next(iter(channels.items()))
+            ready = waiting.popleft()
+            # Rotate the channel to the back so channels take turns
+            del channels[channel]
+            if waiting:
+                channels[channel] = waiting
+            if not channels:
+                del self.queues[priority]
+            self.queued -= 1
+            if not ready.done():  # skip requests cancelled while waiting
+                ready.set_result(None)
+                return
+        self.running -= 1
+
+    def _discard(self, ready):
+        for priority, channels in list(self.queues.items()):
+            for channel, waiting in list(channels.items()):
+                if ready in waiting:
+                    waiting.remove(ready)
+                    self.queued -= 1
+                    if not waiting:
+                        del channels[channel]
+                    if not channels:
+                        del self.queues[priority]
+                    return
+
+
+def parse_setting_pairs(name, value, key=str, convert=str):
+    """Parse a comma-separated key=value setting; blank items are skipped, malformed ones logged and ignored"""
+    pairs = {}
+    for item in value.split(','):
+        if not item.strip():
+            continue
+        try:
+            item_key, item_value = item.split('=', 1)
+            pairs[key(item_key.strip())] = convert(item_value.strip())
+        except ValueError:
+            print(f"⚠️ Ignoring malformed {name} entry {item.strip()!r}, expected key=value")
+    return pairs
+
+
+def format_age(seconds):
+    """Human-readable duration such as '45s', '12m' or '3h 5m'"""
+    seconds = int(max(seconds, 0))
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m"
+    if seconds < 86400:
+        return f"{seconds // 3600}h {seconds % 3600 // 60}m"
+    return f"{seconds // 86400}d {seconds % 86400 // 3600}h"
+
+
+class StartupTimer:
+    """Records how long each cold-start phase took, so boot regressions show up in the logs"""
+
+    def __init__(self, start):
+        self.start = start
+        self.phases = OrderedDict()
+
+    def record(self, phase, seconds):
+        """Record a phase duration; only the first measurement of each phase is kept"""
+        if phase in self.phases:
+            return
+        self.phases[phase] = seconds
+        print(f"⏱️ Startup phase '{phase}': {seconds:.2f}s (t+{time.perf_counter() - self.start:.2f}s)")
+
+    def summary(self):
+        return ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in self.phases.items())
+
+
 class FreshdeskKBBot:
     # Define ALLOWED_CATEGORIES as a class attribute
     ALLOWED_CATEGORIES = [
@@ -160,9 +2098,115 @@ class FreshdeskKBBot:
     ]
 
     TICKET_PROCESSOR_BOT_ID = 1325036182496874538
-    
+
+    # Maximum number of Freshdesk requests in flight while loading the knowledge base
+    FRESHDESK_MAX_CONCURRENCY = int(os.getenv('FRESHDESK_MAX_CONCURRENCY', '8'))
+
+    OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-4-turbo-preview')
+
+    # Minimum seconds between progressive edits of a streamed answer
+    DISCORD_EDIT_INTERVAL = float(os.getenv('DISCORD_EDIT_INTERVAL', '1.0'))
+
+    EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+    EMBEDDING_STORE_DIR = os.getenv('EMBEDDING_STORE_DIR', 'embedding_store')
+    # Articles, passages and embeddings from the last successful load, served at boot until a refresh
+    # completes; also holds the article text blob the live ArticleStore reads bodies from
+    KB_SNAPSHOT_DIR = os.getenv('KB_SNAPSHOT_DIR', 'kb_snapshot')
+    # 'torch' (sentence-transformers) or 'onnx' (int8-quantized ONNX Runtime)
+    EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'torch')
+    EMBEDDING_THREADS = int(os.getenv('EMBEDDING_THREADS', '4'))
+    ONNX_MODEL_DIR = os.getenv('ONNX_MODEL_DIR', 'onnx_model')
+
+    # Articles are indexed as overlapping passages of this many words
+    PASSAGE_WORDS = int(os.getenv('PASSAGE_WORDS', '150'))
+    PASSAGE_OVERLAP = int(os.getenv('PASSAGE_OVERLAP', '30'))
+    # Passages sent to the model per matched article
+    MAX_PASSAGES_PER_ARTICLE = 2
+
+    # Semantic answer cache: minimum question similarity for a hit, size cap and TTL in seconds
+    ANSWER_CACHE_THRESHOLD = float(os.getenv('ANSWER_CACHE_THRESHOLD', '0.92'))
+    ANSWER_CACHE_SIZE = int(os.getenv('ANSWER_CACHE_SIZE', '256'))
+    ANSWER_CACHE_TTL = float(os.getenv('ANSWER_CACHE_TTL', '3600'))
+
+    NO_RESULTS_MESSAGE = (
+        "I couldn't find any relevant information in our knowledge base. "
+        "Please try:\n"
+        "• Rephrasing your question\n"
+        "• Being more specific\n"
+        "• Asking about a different topic\n\n"
+        "Available categories:\n"
+        "• General Info\n"
+        "• Training Programme (Customer Success)\n"
+        "• Workflow\n"
+        "• Corporate Gift Products\n"
+        "• Product Specific Articles"
+    )
+
+    # 'exact', 'hnsw', or 'auto' (HNSW once the KB reaches VectorIndex.ANN_THRESHOLD vectors)
+    VECTOR_INDEX_BACKEND = os.getenv('VECTOR_INDEX_BACKEND', 'auto')
+
+    # Hybrid retrieval: weight of the BM25 score (relative to the best lexical hit) against cosine similarity
+    HYBRID_LEXICAL_WEIGHT = float(os.getenv('HYBRID_LEXICAL_WEIGHT', '0.3'))
+    # Answer from BM25 alone, skipping the embedding model, when the best article matches at least
+    # this share of the question's keywords (see BM25Index.reference_score) and its raw score beats
+    # the runner-up by the margin factor
+    LEXICAL_FAST_PATH_MIN_MATCH = float(os.getenv('LEXICAL_FAST_PATH_MIN_MATCH', '0.9'))
+    LEXICAL_FAST_PATH_MARGIN = float(os.getenv('LEXICAL_FAST_PATH_MARGIN', '2.0'))
+
+    # Minimum cosine similarity for a passage to count as a match
+    RETRIEVAL_MIN_SCORE = float(os.getenv('RETRIEVAL_MIN_SCORE', '0.2'))
+    # Up to MAX_CONTEXT_ARTICLES articles go into the prompt, keeping those that score at least
+    # CONTEXT_RELATIVE_SCORE times the best match
+    MAX_CONTEXT_ARTICLES = int(os.getenv('MAX_CONTEXT_ARTICLES', '5'))
+    CONTEXT_RELATIVE_SCORE = float(os.getenv('CONTEXT_RELATIVE_SCORE', '0.8'))
+    # Input token budget for the whole prompt; the lowest-scoring articles are trimmed, then dropped, to fit
+    PROMPT_TOKEN_BUDGET = int(os.getenv('PROMPT_TOKEN_BUDGET', '2500'))
+    # An article is only trimmed if at least this many tokens of its content still fit
+    MIN_TRIMMED_ARTICLE_TOKENS = 80
+    MAX_COMPLETION_TOKENS = 1000
+
+    # Request scheduler: answers generated at once, waiting-queue limit, and priority per source
+    # ('human' for !ask, 'bot' for the Ticket Processor, 'api' for /api/ask; lower runs first).
+    # 'api' defaults to the 'bot' priority; any other source left out runs after all the listed ones
+    ANSWER_WORKERS = int(os.getenv('ANSWER_WORKERS', '4'))
+    ANSWER_QUEUE_LIMIT = int(os.getenv('ANSWER_QUEUE_LIMIT', '20'))
+    ANSWER_PRIORITIES = parse_setting_pairs(
+        'ANSWER_PRIORITIES', os.getenv('ANSWER_PRIORITIES', 'human=0,bot=1,api=1'), convert=int
+    )
+    if 'bot' in ANSWER_PRIORITIES:
+        # Unless configured separately, batch API answers rank with the Ticket Processor's
+        ANSWER_PRIORITIES.setdefault('api', ANSWER_PRIORITIES['bot'])
+    # Shared secret Freshdesk automations send in X-Webhook-Secret (or as a Bearer token)
+    # to /webhooks/freshdesk/article; the endpoint is disabled while this is unset
+    WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+    # Webhook event names, including the past-tense forms automations tend to send
+    ARTICLE_WEBHOOK_EVENTS = {
+        'create': 'create', 'created': 'create',
+        'update': 'update', 'updated': 'update',
+        'publish': 'publish', 'published': 'publish',
+        'delete': 'delete', 'deleted': 'delete',
+    }
+
+    # Batch ask API for machine clients (POST /api/ask, key in X-API-Key or as a Bearer token; disabled
+    # while ASK_API_KEY is unset): questions per call, answers generated at once per call, seconds per call
+    ASK_API_KEY = os.getenv('ASK_API_KEY', '')
+    BATCH_ASK_MAX_QUESTIONS = int(os.getenv('BATCH_ASK_MAX_QUESTIONS', '20'))
+    BATCH_ASK_CONCURRENCY = int(os.getenv('BATCH_ASK_CONCURRENCY', '4'))
+    BATCH_ASK_TIMEOUT = float(os.getenv('BATCH_ASK_TIMEOUT', '120'))
+    # Channels whose !ask questions only search one category or folder, as comma-separated
+    # channel_id=scope pairs (scope is 'Category' or 'Category/Folder'); --scope overrides it
+    CHANNEL_SCOPES = parse_setting_pairs('CHANNEL_SCOPES', os.getenv('CHANNEL_SCOPES', ''), key=int)
+
+    BUSY_MESSAGE = (
+        "🚦 I'm answering a lot of questions right now and my queue is full. "
+        "Please try again in a minute."
+    )
+
     def __init__(self, discord_token, freshdesk_domain, freshdesk_api_key, 
-                openai_api_key, sheets_creds_json, spreadsheet_id):
+                openai_api_key, sheets_creds_json, spreadsheet_id, sheets_service=None):
+        self.startup = StartupTimer(PROCESS_START)
+        self.startup.record('import', IMPORTS_DONE - PROCESS_START)
+
         # Initialize bot
         intents = discord.Intents.default()
         intents.message_content = True
@@ -173,18 +2217,81 @@ class FreshdeskKBBot:
         self.freshdesk_domain = freshdesk_domain
         self.freshdesk_api_key = freshdesk_api_key
         self.base_url = f"https://{freshdesk_domain}.freshdesk.com/api/v2"
+        self.article_url_prefix = f"https://{freshdesk_domain}.freshdesk.com/a/solutions/articles/"
+        self.freshdesk = FreshdeskClient(freshdesk_api_key, self.FRESHDESK_MAX_CONCURRENCY)
 
-        # Initialize OpenAI client
-        self.openai_client = OpenAI(api_key=openai_api_key)
+        # Initialize OpenAI client; OPENAI_BASE_URL can point it at any OpenAI-compatible server
+        self.openai_client = AsyncOpenAI(api_key=openai_api_key, base_url=os.getenv('OPENAI_BASE_URL') or None)
 
-        # Initialize Google Sheets logger
-        self.sheets_logger = GoogleSheetsLogger(sheets_creds_json, spreadsheet_id)
+        # Initialize Google Sheets logger; the header check runs in setup_hook so login isn't delayed
+        self.sheets_logger = GoogleSheetsLogger(
+            sheets_creds_json, spreadsheet_id, initialize=False, service=sheets_service
+        )
 
-        # Initialize empty cache
-        self.kb_cache = []
-        self.kb_embeddings = None
+        # Initialize empty cache; every load publishes a new KBIndex here
+        self.kb = KBIndex()
+        self.retrieval_latency = LatencyStats()
+        self.token_counter = TokenCounter(self.OPENAI_MODEL)
+        self.token_usage = {'requests': 0, 'prompt': 0, 'completion': 0}
+        self.last_refresh = None
+        # 'snapshot' while serving a restored snapshot, 'live' once a Freshdesk load has completed
+        self.kb_source = None
+        self.snapshot_info = None
+        # Event loop the bot runs on, for work handed over from the Flask thread
+        self.loop = None
         self._model = None
         self._model_loaded = False
+        self._model_lock = Lock()
+        self._kb_load_lock = asyncio.Lock()
+        self._background_tasks = set()
+        self._initial_load = None
+        if self.EMBEDDING_BACKEND not in EMBEDDING_BACKENDS:
+            raise ValueError(f"Unknown EMBEDDING_BACKEND '{self.EMBEDDING_BACKEND}', "
+                             f"expected one of: {', '.join(EMBEDDING_BACKENDS)}")
+        if self.EMBEDDING_BACKEND == 'onnx':
+            # The model loads lazily, so a missing runtime would otherwise only show up as failed answers
+            try:
+                import onnxruntime  # noqa: F401
+                import tokenizers  # noqa: F401
+            except ImportError as e:
+                raise RuntimeError(f"EMBEDDING_BACKEND=onnx needs onnxruntime and tokenizers ({e}); "
+                                   f"install them with the 'onnx' extra: pip install '.[onnx]'") from e
+
+        # Vectors from different backends are stored separately
+        embedding_model_key = self.EMBEDDING_MODEL_NAME + EMBEDDING_BACKENDS[self.EMBEDDING_BACKEND].suffix
+        self.embedding_store = EmbeddingStore(self.EMBEDDING_STORE_DIR, embedding_model_key)
+        self.kb_snapshot = KBSnapshot(self.KB_SNAPSHOT_DIR, embedding_model_key)
+
+        self.answer_cache = SemanticAnswerCache(
+            self.ANSWER_CACHE_THRESHOLD, self.ANSWER_CACHE_SIZE, self.ANSWER_CACHE_TTL
+        )
+
+        # Concurrent copies of the same question share one retrieval + LLM call
+        self.inflight_answers = SingleFlight()
+
+        # Caps concurrent answers and orders the waiting ones by source and channel
+        self.scheduler = RequestScheduler(self.ANSWER_WORKERS, self.ANSWER_QUEUE_LIMIT, self.ANSWER_PRIORITIES)
+
+        # Question embeddings run on their own thread so the model never blocks the event loop
+        self.query_encoder = QueryEncoder(
+            self.encode_texts,
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix='query-encoder')
+        )
+
+        # Gauges on /metrics are read from the live state at scrape time
+        metrics.add_collector(self.collect_metrics)
+        app.config['ARTICLE_WEBHOOK'] = self.handle_article_webhook
+        app.config['BATCH_ASK'] = self.handle_batch_ask
+
+        # Flush queued Sheets rows and release the Freshdesk connection pool before the bot disconnects
+        close_bot = self.bot.close
+
+        async def close():
+            await self.sheets_logger.close()
+            await self.freshdesk.close()
+            await close_bot()
+
+        self.bot.close = close
 
         # Remove default help command AFTER bot is initialized
         self.bot.remove_command('help')
@@ -195,20 +2302,67 @@ class FreshdeskKBBot:
     @property
     def model(self):
         if not self._model_loaded:
-            try:
-                print("Loading sentence transformer model...")
-                # Add timeout and device placement
-                os.environ['TOKENIZERS_PARALLELISM'] = 'false'
-                self._model = SentenceTransformer('all-MiniLM-L6-v2', device='cpu')
-                torch.set_num_threads(4)  # Limit threads
-                self._model_loaded = True
-                print("Model loaded successfully")
-            except Exception as e:
-                print(f"Error loading model: {str(e)}")
-                self._model = None
-                self._model_loaded = False
+            # The model may be requested from executor threads and the event loop at once
+            with self._model_lock:
+                if not self._model_loaded:
+                    try:
+                        print(f"Loading {self.EMBEDDING_BACKEND} embedding model...")
+                        load_start = time.perf_counter()
+                        self._model = self.create_embedding_backend()
+                        self._model_loaded = True
+                        self.startup.record('model load', time.perf_counter() - load_start)
+                        print("Model loaded successfully")
+                    except Exception as e:
+                        print(f"Error loading model: {str(e)}")
+                        self._model = None
+                        self._model_loaded = False
         return self._model
 
+    def collect_metrics(self):
+        """Set the gauges derived from the KB index and caches; runs on every /metrics scrape"""
+        kb = self.kb
+        index, lexical = kb.index, kb.lexical
+        metrics.set('kb_bot_kb_articles', len(kb))
+        metrics.set('kb_bot_index_vectors', len(index) if index is not None else 0)
+        metrics.set('kb_bot_index_terms', len(lexical.postings) if lexical is not None else 0)
+        metrics.set('kb_bot_embedding_matrix_bytes', index.nbytes if index is not None else 0)
+        metrics.set('kb_bot_article_blob_bytes', kb.articles.blob_size)
+        metrics.set('kb_bot_scheduler_running', self.scheduler.running)
+        metrics.set('kb_bot_scheduler_queued', self.scheduler.queued)
+        if self.last_refresh is not None:
+            metrics.set('kb_bot_last_refresh_duration_seconds', self.last_refresh['duration'])
+            metrics.set('kb_bot_last_refresh_age_seconds', time.time() - self.last_refresh['finished'])
+
+        for cache, hits, misses in (
+            ('answer', self.answer_cache.hits, self.answer_cache.misses),
+            ('embedding_store', self.embedding_store.hits, self.embedding_store.misses),
+            ('freshdesk_conditional', self.freshdesk.not_modified,
+             self.freshdesk.revalidated - self.freshdesk.not_modified),
+        ):
+            metrics.set('kb_bot_cache_hits_total', hits, cache=cache)
+            metrics.set('kb_bot_cache_misses_total', misses, cache=cache)
+            metrics.set('kb_bot_cache_hit_ratio', hits / (hits + misses) if hits + misses else 0, cache=cache)
+
+    def create_embedding_backend(self):
+        """Instantiate the embedding backend selected by EMBEDDING_BACKEND"""
+        if self.EMBEDDING_BACKEND == 'onnx':
+            return OnnxEmbeddingBackend(self.EMBEDDING_MODEL_NAME, self.EMBEDDING_THREADS, self.ONNX_MODEL_DIR)
+        return SentenceTransformerBackend(self.EMBEDDING_MODEL_NAME, self.EMBEDDING_THREADS)
+
+    def spawn(self, coro):
+        """Run a coroutine in the background, keeping a reference until it finishes"""
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return task
+
+    def encode_texts(self, texts):
+        """Run the embedding model over texts; blocking, so call it from a worker thread"""
+        model = self.model
+        if model is None:
+            raise RuntimeError("Embedding model is not available")
+        return model.encode(texts)
+
     async def check_allowed_author(self, message_or_ctx):
         """
         Enhanced permission check that works with both Message and Context objects
@@ -223,46 +2377,312 @@ class FreshdeskKBBot:
 
         return (not author.bot) or (author.id == self.TICKET_PROCESSOR_BOT_ID)
 
+    async def stream_answer(self, send, question, prefix, source='human', channel=None, scope=None):
+        """Post a placeholder, stream the GPT answer into it and attach the feedback buttons
+
+        The answer waits its turn in the request scheduler; if it has to queue,
+        the placeholder says so. Raises SchedulerBusy without posting anything
+        when the queue is full. Returns the answer_question result and the
+        Discord message holding it.
+        """
+        # A question already being answered is joined without a worker, so it is never turned away
+        if self.scheduler.full and not self.inflight_answers.running(self.answer_key(question, scope)):
+            raise SchedulerBusy(f"{self.scheduler.queued} requests already queued")
+
+        reply = StreamingReply(send, prefix, self.DISCORD_EDIT_INTERVAL)
+        with metrics.timer('kb_bot_stage_duration_seconds', pipeline='answer', stage='discord_send'):
+            await reply.start()
+
+        async def queued(position):
+            await reply.notify(f"⏳ I'm busy with other questions right now. "
+                               f"Yours is queued at position {position} and will be answered here shortly.")
+
+        try:
+            with metrics.timer('kb_bot_stage_duration_seconds', pipeline='answer', stage='answer'):
+                result = await self.answer_question(
+                    question, on_update=reply.update, scope=scope,
+                    source=source, channel=channel, on_queued=queued
+                )
+            view = FeedbackView(question, result['answer'])
+            with metrics.timer('kb_bot_stage_duration_seconds', pipeline='answer', stage='discord_final_edit'):
+                message = await reply.finish(result['answer'], view=view)
+        except Exception:
+            if reply.message is not None:
+                try:
+                    await reply.message.delete()
+                except Exception:
+                    pass
+            raise
+        return result, message
+
+    def parse_scope(self, question, channel_id=None):
+        """Split an optional leading `--scope <name>` off an !ask question
+
+        The name may be quoted; unquoted, the longest category, category/folder
+        or folder name the question starts with is taken, so multi-word names
+        work without quotes. Without the flag, the channel's CHANNEL_SCOPES
+        entry applies. Returns the question and the scope name (or None).
+        """
+        flag = re.match(r'\s*--scope(?:=|\s+)', question)
+        if not flag:
+            return question, self.CHANNEL_SCOPES.get(channel_id)
+
+        rest = question[flag.end():]
+        quoted = re.match(r'"([^"]+)"|\'([^\']+)\'', rest)
+        if quoted:
+            return rest[quoted.end():].strip(), quoted.group(1) or quoted.group(2)
+        for name in sorted(self.kb.scope_names(), key=len, reverse=True):
+            if rest.lower().startswith(name.lower()) and rest[len(name):len(name) + 1] in ('', ' ', '\n', ':', ','):
+                return rest[len(name):].lstrip(' \n:,'), name
+        name, _, remainder = rest.partition(' ')
+        return remainder.strip(), name
+
+    def resolve_scope(self, question, channel_id=None):
+        """parse_scope() plus a check that the scope exists in the published KB
+
+        Returns the question, the canonical scope name (or None) and an error
+        message to send instead of answering (or None).
+        """
+        question, scope = self.parse_scope(question, channel_id)
+        if scope is not None:
+            partition = self.kb.scope(scope)
+            if partition is None:
+                categories = sorted({p['category'] for p in self.kb.partitions.values()})
+                return question, None, (f"❌ Unknown scope '{scope}'. Use a category or `Category/Folder`: "
+                                        + ", ".join(categories))
+            scope = partition['name']
+        if not question.strip():
+            return question, scope, "Please add your question, e.g. `!ask --scope Workflow How do I process a rush order?`"
+        return question, scope, None
+
+    def record_request(self, source, start, outcome):
+        metrics.observe('kb_bot_request_duration_seconds', time.perf_counter() - start, source=source)
+        metrics.inc('kb_bot_requests_total', source=source, outcome=outcome)
+
     async def process_bot_command(self, message, question):
         """
         Process commands specifically from the Ticket Processor bot
         """
-        try:
-            async with message.channel.typing():
-                # Get the response from GPT
-                response = await self.get_gpt_answer(question)
-
-                # Log the interaction
-                self.sheets_logger.log_interaction(
-                    question=question,
-                    answer=response,
-                    status="Bot Interaction"  # Special status for bot interactions
-                )
+        # Same --scope flag and channel scopes as !ask
+        question, scope, error = self.resolve_scope(question, message.channel.id)
+        if error:
+            await message.channel.send(error)
+            return None
 
-                # Create feedback view
-                view = FeedbackView(question, response)
+        start = time.perf_counter()
+        try:
+            # Stream the response from GPT into the channel
+            result, reply = await self.stream_answer(
+                message.channel.send,
+                question,
+                f"Question from Ticket Processor Bot: {question}\n" + (f"Scope: {scope}\n" if scope else "") + "\n",
+                source='bot',
+                channel=message.channel.id,
+                scope=scope
+            )
 
-                # Send response with feedback buttons
-                await message.channel.send(
-                    f"Question from Ticket Processor Bot: {question}\n\n{response}",
-                    view=view
-                )
+            # Log the interaction
+            self.sheets_logger.log_interaction(
+                question=f"[{scope}] {question}" if scope else question,
+                answer=result['answer'],
+                # Special status for bot interactions
+                status="Bot Interaction (Cache Hit)" if result['cache_hit'] else "Bot Interaction",
+                message_id=reply.id
+            )
+            self.record_request('bot', start, 'cache_hit' if result['cache_hit'] else 'answered')
 
-                # Return the response in case the bot needs it
-                return response
+            # Return the response in case the bot needs it
+            return result['answer']
 
+        except SchedulerBusy:
+            self.record_request('bot', start, 'rejected')
+            await message.channel.send(self.BUSY_MESSAGE)
+            return None
         except Exception as e:
             error_msg = f"Error processing bot question: {str(e)}"
             print(error_msg)
+            self.record_request('bot', start, 'error')
             await message.channel.send("Sorry, I encountered an error while processing the question. Please try again.")
             return None
         
+    def handle_batch_ask(self, headers, payload):
+        """Authenticate and validate a batch-ask call, then wait for its answers; runs on a Flask thread
+
+        The body is {"questions": [...]}, each item a question string or an
+        object with "question", an optional caller-chosen "id" and an optional
+        "scope" (a category or 'Category/Folder' to search in). Returns the
+        JSON body and HTTP status.
+        """
+        if not self.ASK_API_KEY:
+            return {'error': 'batch ask API is disabled, set ASK_API_KEY'}, 404
+        if not secret_matches(headers, 'X-API-Key', self.ASK_API_KEY):
+            return {'error': 'unauthorized'}, 401
+
+        questions = payload.get('questions') if isinstance(payload, dict) else None
+        if not isinstance(questions, list) or not questions:
+            return {'error': 'expected {"questions": [...]} with at least one question'}, 400
+        if len(questions) > self.BATCH_ASK_MAX_QUESTIONS:
+            return {'error': f'at most {self.BATCH_ASK_MAX_QUESTIONS} questions per call'}, 413
+
+        items = []
+        for position, item in enumerate(questions):
+            if isinstance(item, str):
+                item = {'question': item}
+            question = str(item.get('question') or '').strip() if isinstance(item, dict) else ''
+            if not question:
+                return {'error': f'questions[{position}] has no question text'}, 400
+            scope = item.get('scope')
+            if scope:
+                partition = self.kb.scope(scope)
+                if partition is None:
+                    return {'error': f'questions[{position}] has an unknown scope {scope!r}'}, 400
+                scope = partition['name']
+            items.append({'id': item.get('id', position), 'question': question, 'scope': scope or None})
+
+        loop = self.loop
+        if loop is None or loop.is_closed():
+            return {'error': 'bot is not connected yet'}, 503
+
+        future = asyncio.run_coroutine_threadsafe(self.answer_batch(items), loop)
+        try:
+            answers = future.result(timeout=self.BATCH_ASK_TIMEOUT)
+        except FutureTimeoutError:
+            future.cancel()
+            return {'error': f'answers took longer than {self.BATCH_ASK_TIMEOUT:.0f}s'}, 504
+        return {'answers': answers}, 200
+
+    async def answer_batch(self, items):
+        """Answer a batch of {'id', 'question', 'scope'} items for the batch ask API
+
+        The questions are embedded in one batched encode, then answered at most
+        BATCH_ASK_CONCURRENCY at a time through the request scheduler, and
+        logged to Sheets like the Ticket Processor's Discord questions.
+        Returns one result per item, in order.
+        """
+        start = time.perf_counter()
+        try:
+            with metrics.timer('kb_bot_stage_duration_seconds', pipeline='batch', stage='embed'):
+                embeddings = await self.query_encoder.encode_many([item['question'] for item in items])
+        except Exception as e:
+            # Each answer embeds its own question instead (or reports the error)
+            print(f"Error embedding batch questions: {str(e)}")
+            embeddings = [None] * len(items)
+
+        limit = asyncio.Semaphore(max(1, self.BATCH_ASK_CONCURRENCY))
+
+        async def answer(item, embedding):
+            async with limit:
+                try:
+                    result = await self.answer_question(
+                        item['question'], question_embedding=embedding, scope=item['scope'], source='api'
+                    )
+                except SchedulerBusy:
+                    self.record_request('api', start, 'rejected')
+                    return {'id': item['id'], 'question': item['question'], 'error': 'busy'}
+
+            self.sheets_logger.log_interaction(
+                question=f"[{item['scope']}] {item['question']}" if item['scope'] else item['question'],
+                answer=result['answer'],
+                status="API Interaction (Cache Hit)" if result['cache_hit'] else "API Interaction"
+            )
+            self.record_request('api', start, 'cache_hit' if result['cache_hit'] else 'answered')
+            return {
+                'id': item['id'],
+                'question': item['question'],
+                'scope': item['scope'],
+                'answer': result['answer'],
+                'cache_hit': result['cache_hit'],
+                'sources': [
+                    {'id': article['id'], 'title': article['title'], 'url': article['url'],
+                     'category': article['category'], 'score': round(float(article['score']), 4)}
+                    for article in result['articles']
+                ],
+                'tokens': result['tokens'],
+            }
+
+        answers = await asyncio.gather(*(answer(item, embedding) for item, embedding in zip(items, embeddings)))
+        print(f"📦 Answered a batch of {len(items)} questions in {time.perf_counter() - start:.2f}s")
+        return answers
+
+    async def warm_up(self):
+        """Load the embedding model in a background thread while the first KB crawl runs
+
+        If a KB snapshot is on disk it is restored first, so questions are answered
+        from it while the crawl brings the cache up to date incrementally.
+        """
+        # Start the model load now so it overlaps the snapshot restore
+        model_load = self.spawn(asyncio.to_thread(lambda: self.model))
+        await self.restore_snapshot()
+        await asyncio.gather(model_load, self.load_kb_articles())
+        self.startup.record('ready', time.perf_counter() - PROCESS_START)
+        print(f"Cold start: {self.startup.summary()}")
+
+    async def restore_snapshot(self):
+        """Serve the knowledge base from the last snapshot until the first refresh completes"""
+        start = time.perf_counter()
+        snapshot = await asyncio.to_thread(self.kb_snapshot.load)
+        if snapshot is None:
+            print("No KB snapshot to restore, waiting for the first load")
+            return False
+
+        store, positions, spans, vectors, meta = snapshot
+        index = await asyncio.to_thread(VectorIndex, vectors, self.VECTOR_INDEX_BACKEND, True)
+        lexical = await asyncio.to_thread(self.build_lexical_index, store)
+        if self.kb:
+            # A load finished first; it is newer than the snapshot
+            return False
+
+        self.kb = KBIndex(store, positions, spans, index, lexical)
+        self.snapshot_info = meta
+        self.kb_source = 'snapshot'
+        self.startup.record('snapshot restore', time.perf_counter() - start)
+        print(f"♻️ Restored {len(store)} articles and {len(positions)} passages from the KB snapshot "
+              f"written {format_age(time.time() - meta['created'])} ago; refreshing in the background")
+        return True
+
+    def status_report(self):
+        """Summary of the knowledge base, its last refresh and snapshot for the !status command"""
+        now = time.time()
+        kb = self.kb
+        lines = [
+            "**Knowledge Base Status:**",
+            f"• Articles: {len(kb)}, passages: {kb.passage_count}"
+            + (f" (served from {self.kb_source})" if self.kb_source else ""),
+        ]
+        if self.last_refresh is not None:
+            lines.append(f"• Last refresh: {self.last_refresh['mode']}, "
+                         f"{format_age(now - self.last_refresh['finished'])} ago, "
+                         f"took {self.last_refresh['duration']:.1f}s")
+        else:
+            lines.append("• Last refresh: not completed since startup")
+        if self.snapshot_info is not None:
+            lines.append(f"• Snapshot: written {format_age(now - self.snapshot_info['created'])} ago, "
+                         f"last confirmed current {format_age(now - self.snapshot_info['refreshed'])} ago")
+        else:
+            lines.append("• Snapshot: none")
+        lines.append(f"• Answers: {self.scheduler.running} in progress, {self.scheduler.queued} queued")
+        return "\n".join(lines)
+
     def setup_commands(self):
+        @self.bot.event
+        async def setup_hook():
+            # Runs after login, before the gateway connects: start warming up right away
+            self.loop = asyncio.get_running_loop()
+            self._initial_load = self.spawn(self.warm_up())
+            try:
+                await asyncio.to_thread(self.sheets_logger.initialize_sheet)
+            except Exception as e:
+                print(f'Error initializing Google Sheet: {str(e)}')
+
         @self.bot.event
         async def on_ready():
             print(f'{self.bot.user} has connected to Discord!')
             try:
-                await self.load_kb_articles()
+                if self._initial_load is not None and not self._initial_load.done():
+                    await self._initial_load
+                else:
+                    # Reconnects refresh incrementally
+                    await self.load_kb_articles()
                 print('Bot is ready to answer questions! Knowledge base loaded.')
             except Exception as e:
                 print(f'Error loading articles: {str(e)}')
@@ -320,12 +2740,6 @@ class FreshdeskKBBot:
             if interaction.data.get("custom_id") in ["accurate", "not_accurate", "can_improve"]:
                 feedback_type = interaction.data["custom_id"]
                 orig_message = interaction.message
-                message_content = interaction.message.content
-                question_part = message_content.split("Question: ")
-                if len(question_part) > 1:
-                    original_question = question_part[1].split("\n")[0]
-                else:
-                    original_question = "Question not found"
     
                 status_mapping = {
                     "accurate": "Resolved",
@@ -333,23 +2747,24 @@ class FreshdeskKBBot:
                     "can_improve": "Review Needed"
                 }
     
-                self.sheets_logger.update_feedback(
-                    question=original_question,
-                    feedback=feedback_type,
-                    status=status_mapping[feedback_type]
-                )
-    
                 feedback_messages = {
                     "accurate": "Thank you for confirming that the answer was accurate! 🎯",
                     "not_accurate": "Thank you for letting us know the answer wasn't accurate. We'll work on improving it! 🎯",
                     "can_improve": "Thank you for the feedback! We'll work on improving the answer quality. 📈"
                 }
     
+                # Acknowledge first; the sheet update happens in the background
                 await interaction.response.send_message(
                     feedback_messages[feedback_type],
                     ephemeral=True
                 )
     
+                self.spawn(self.sheets_logger.update_feedback(
+                    message_id=orig_message.id,
+                    feedback=feedback_type,
+                    status=status_mapping[feedback_type]
+                ))
+    
                 try:
                     for child in orig_message.components:
                         for button in child.children:
@@ -363,23 +2778,32 @@ class FreshdeskKBBot:
             if not await self.check_allowed_author(ctx):  # Fixed: added self.
                 return
 
-            async with ctx.typing():
-                try:
-                    response = await self.get_gpt_answer(question)
-                    self.sheets_logger.log_interaction(
-                        question=question,
-                        answer=response,
-                        status="New"
-                    )
-                    view = FeedbackView(question, response)
-                    await ctx.send(
-                        f"Question: {question}\n\n{response}",
-                        view=view
-                    )
-                except Exception as e:
-                    error_msg = f"Error processing question: {str(e)}"
-                    print(error_msg)
-                    await ctx.send("Sorry, I encountered an error while processing your question. Please try again.")
+            question, scope, error = self.resolve_scope(question, ctx.channel.id)
+            if error:
+                await ctx.send(error)
+                return
+
+            start = time.perf_counter()
+            try:
+                heading = f"Question: {question}\n" + (f"Scope: {scope}\n" if scope else "") + "\n"
+                result, reply = await self.stream_answer(
+                    ctx.send, question, heading, source='human', channel=ctx.channel.id, scope=scope
+                )
+                self.sheets_logger.log_interaction(
+                    question=f"[{scope}] {question}" if scope else question,
+                    answer=result['answer'],
+                    status="Cache Hit" if result['cache_hit'] else "New",
+                    message_id=reply.id
+                )
+                self.record_request('ask', start, 'cache_hit' if result['cache_hit'] else 'answered')
+            except SchedulerBusy:
+                self.record_request('ask', start, 'rejected')
+                await ctx.send(self.BUSY_MESSAGE)
+            except Exception as e:
+                error_msg = f"Error processing question: {str(e)}"
+                print(error_msg)
+                self.record_request('ask', start, 'error')
+                await ctx.send("Sorry, I encountered an error while processing your question. Please try again.")
 
         @self.bot.command(name='help')
         async def help_command(ctx):
@@ -389,10 +2813,13 @@ class FreshdeskKBBot:
             help_text = (
                 "**Available Commands:**\n"
                 "`!ask <your question>` - Ask me anything about our knowledge base\n"
+                "`!ask --scope <category or Category/Folder> <your question>` - Only search that part of it\n"
                 "`!help` - Show this help message\n"
                 "`!diagnose` - Run diagnostic on Freshdesk folders\n"
                 "`!visibility <folder_id>` - Check and update folder visibility\n"
-                "`!refresh` - Manually refresh the knowledge base to fetch new articles\n\n"
+                "`!refresh` - Manually refresh the knowledge base to fetch new and changed articles\n"
+                "`!refresh full` - Re-download and re-embed every article from scratch\n"
+                "`!status` - Show knowledge base size, last refresh and snapshot age\n\n"
                 "**Available Categories:**\n"
                 "• General Info\n"
                 "• Training Programme (Customer Success)\n"
@@ -402,7 +2829,8 @@ class FreshdeskKBBot:
                 "**Example Questions:**\n"
                 "• `!ask How do I process a corporate gift order?`\n"
                 "• `!ask What's included in the customer success training?`\n"
-                "• `!ask Tell me about our product specifications`\n\n"
+                "• `!ask Tell me about our product specifications`\n"
+                "• `!ask --scope Workflow How do I handle a rush order?`\n\n"
                 "**Note:**\n"
                 "After each answer, you can provide feedback using the buttons below the response.\n"
                 "To check a folder's visibility, first use `!diagnose` to get folder IDs, then use `!visibility <folder_id>`"
@@ -427,134 +2855,98 @@ class FreshdeskKBBot:
                 await ctx.send("Visibility check complete. Please check the console output.")
 
         @self.bot.command(name='refresh')
-        async def refresh(ctx):
+        async def refresh(ctx, mode: str = "incremental"):
             if not await self.check_allowed_author(ctx):
                 return
                 
-            """Manual refresh command to reload all articles"""
+            """Manual refresh command; `!refresh full` reloads every article from scratch"""
             try:
                 async with ctx.typing():
-                    await ctx.send("🔄 Starting knowledge base refresh...")
-                    await self.load_kb_articles()  # Reload all articles
-                    await ctx.send(f"✅ Knowledge base refreshed successfully! Total articles in cache: {len(self.kb_cache)}")
+                    full = mode.lower() == "full"
+                    await ctx.send(f"🔄 Starting {'full' if full else 'incremental'} knowledge base refresh...")
+                    await self.load_kb_articles(incremental=not full)
+                    await ctx.send(f"✅ Knowledge base refreshed successfully! Total articles in cache: {len(self.kb)}")
             except Exception as e:
                 await ctx.send(f"❌ Error refreshing knowledge base: {str(e)}")
 
+        @self.bot.command(name='status')
+        async def status(ctx):
+            if not await self.check_allowed_author(ctx):
+                return
+            await ctx.send(self.status_report())
+
     async def check_folder_visibility(self, folder_id):
         """Check and optionally update a folder's visibility settings"""
-        auth_str = f"{self.freshdesk_api_key}:X"
-        auth_bytes = auth_str.encode('ascii')
-        base64_auth = base64.b64encode(auth_bytes).decode('ascii')
-
-        headers = {
-            'Content-Type': 'application/json',
-            'Authorization': f'Basic {base64_auth}'
-        }
-
-        async with aiohttp.ClientSession() as session:
-            # Get current folder settings
-            url = f"{self.base_url}/solutions/folders/{folder_id}"
-            try:
-                async with session.get(url, headers=headers) as response:
-                    if response.status == 200:
-                        folder = await response.json()
-                        print(f"\nFolder: {folder['name']}")
-                        print(f"Current visibility: {folder.get('visibility', 'Not specified')}")
-
-                        # To update visibility (example to set to "Logged In Users")
-                        update_data = {
-                            'visibility': 2  # 2 for Logged In Users
-                        }
-
-                        update_url = f"{self.base_url}/solutions/folders/{folder_id}"
-                        async with session.put(update_url, headers=headers, json=update_data) as update_response:
-                            if update_response.status == 200:
-                                updated = await update_response.json()
-                                print(f"✅ Updated visibility to: {updated.get('visibility')}")
-                            else:
-                                print(f"❌ Error updating visibility: {update_response.status}")
-                    else:
-                        print(f"❌ Error getting folder: {response.status}")
+        # Get current folder settings
+        url = f"{self.base_url}/solutions/folders/{folder_id}"
+        try:
+            status, folder = await self.freshdesk.request('GET', url)
+            if status == 200:
+                print(f"\nFolder: {folder['name']}")
+                print(f"Current visibility: {folder.get('visibility', 'Not specified')}")
+
+                # To update visibility (example to set to "Logged In Users")
+                update_data = {
+                    'visibility': 2  # 2 for Logged In Users
+                }
 
-            except Exception as e:
-                print(f"Error: {str(e)}")
-                
+                update_status, updated = await self.freshdesk.request('PUT', url, json=update_data)
+                if update_status == 200:
+                    print(f"✅ Updated visibility to: {updated.get('visibility')}")
+                else:
+                    print(f"❌ Error updating visibility: {update_status}")
+            else:
+                print(f"❌ Error getting folder: {status}")
 
-    async def async_get(self, session, url, headers):
-        """Make async HTTP GET request with timeout"""
-        try:
-            async with session.get(url, headers=headers, timeout=30) as response:
-                if response.status == 401:
-                    print("Authentication failed. Please check your Freshdesk API key.")
-                    return None
-                elif response.status != 200:
-                    print(f"Error: Status {response.status} for URL {url}")
-                    return None
-                return await response.json()
-        except asyncio.TimeoutError:
-            print(f"Timeout accessing {url}")
-            return None
         except Exception as e:
-            print(f"Error accessing {url}: {str(e)}")
-            return None
+            print(f"Error: {str(e)}")
+
 
     async def diagnose_folder_issues(self):
         """Diagnose issues with Freshdesk folder access"""
         print("\nStarting Freshdesk folder diagnostic...\n")
 
-        auth_str = f"{self.freshdesk_api_key}:X"
-        auth_bytes = auth_str.encode('ascii')
-        base64_auth = base64.b64encode(auth_bytes).decode('ascii')
-
-        headers = {
-            'Content-Type': 'application/json',
-            'Authorization': f'Basic {base64_auth}'
-        }
-
-        async with aiohttp.ClientSession() as session:
-            # Test API connection
-            test_url = f"{self.base_url}/solutions/categories"
-            try:
-                async with session.get(test_url, headers=headers) as response:
-                    print(f"API Connection Test:")
-                    print(f"Status: {response.status}")
-                    if response.status == 401:
-                        print("❌ Authentication failed - Please verify your API key")
-                        return "Authentication failed. Please check your API key."
-                    elif response.status != 200:
-                        print(f"❌ API access error: {response.status}")
-                        return f"API access error: {response.status}"
-                    print("✅ API connection successful")
-
-                    # Get and print all categories
-                    categories = await response.json()
-                    print("\nFound Categories:")
-                    for category in categories:
-                        print(f"\nCategory: {category['name']} (ID: {category['id']})")
-
-                        # Get folders for each category
-                        folders_url = f"{self.base_url}/solutions/categories/{category['id']}/folders"
-                        async with session.get(folders_url, headers=headers) as folders_response:
-                            if folders_response.status == 200:
-                                folders = await folders_response.json()
-                                print(f"Folders in this category:")
-                                if not folders:
-                                    print("  - No folders found")
-                                for folder in folders:
-                                    print(f"  - {folder['name']} (ID: {folder['id']})")
-                                    print(f"    Visibility: {folder.get('visibility', 'Not specified')}")
-                                    print(f"    Articles Count: {folder.get('articles_count', 'Not specified')}")
-                                    if folder.get('company_ids'):
-                                        print(f"    Restricted to companies: {folder['company_ids']}")
-                            else:
-                                print(f"❌ Error listing folders: {folders_response.status}")
+        # Test API connection
+        test_url = f"{self.base_url}/solutions/categories"
+        try:
+            status, categories = await self.freshdesk.request('GET', test_url, conditional=True)
+            print(f"API Connection Test:")
+            print(f"Status: {status}")
+            if status == 401:
+                print("❌ Authentication failed - Please verify your API key")
+                return "Authentication failed. Please check your API key."
+            elif status != 200:
+                print(f"❌ API access error: {status}")
+                return f"API access error: {status}"
+            print("✅ API connection successful")
+
+            # Get and print all categories
+            print("\nFound Categories:")
+            for category in categories:
+                print(f"\nCategory: {category['name']} (ID: {category['id']})")
+
+                # Get folders for each category
+                folders_url = f"{self.base_url}/solutions/categories/{category['id']}/folders"
+                folders_status, folders = await self.freshdesk.request('GET', folders_url, conditional=True)
+                if folders_status == 200:
+                    print(f"Folders in this category:")
+                    if not folders:
+                        print("  - No folders found")
+                    for folder in folders:
+                        print(f"  - {folder['name']} (ID: {folder['id']})")
+                        print(f"    Visibility: {folder.get('visibility', 'Not specified')}")
+                        print(f"    Articles Count: {folder.get('articles_count', 'Not specified')}")
+                        if folder.get('company_ids'):
+                            print(f"    Restricted to companies: {folder['company_ids']}")
+                else:
+                    print(f"❌ Error listing folders: {folders_status}")
 
-            except Exception as e:
-                error_msg = f"Error during diagnosis: {str(e)}"
-                print(error_msg)
-                return error_msg
+        except Exception as e:
+            error_msg = f"Error during diagnosis: {str(e)}"
+            print(error_msg)
+            return error_msg
 
-            return "Diagnostic complete. Please check the console output."
+        return "Diagnostic complete. Please check the console output."
 
     async def diagnose_command(self, ctx):
         """Run diagnostic tests on Freshdesk folder access"""
@@ -563,17 +2955,38 @@ class FreshdeskKBBot:
             result = await self.diagnose_folder_issues()
             await ctx.send(result)
 
-    async def get_all_articles_from_folder(self, session, folder_id, headers):
-        """Fetch all articles from a folder using pagination"""
+    async def get_all_articles_from_folder(self, folder_id, articles_count=None):
+        """Fetch all articles from a folder using pagination
+
+        When the folder reports its articles_count, all known pages are requested
+        concurrently; otherwise pages are walked one at a time until a short page.
+        """
         all_articles = []
-        page = 1
         per_page = 30  # Freshdesk's default page size
 
+        def page_url(page):
+            return f"{self.base_url}/solutions/folders/{folder_id}/articles?page={page}&per_page={per_page}"
+
+        page = 1
+        if articles_count:
+            page_count = -(-int(articles_count) // per_page)
+            print(f"  📄 Fetching {page_count} page(s) of articles concurrently...")
+            pages = await asyncio.gather(*(
+                self.freshdesk.get_json(page_url(p))
+                for p in range(1, page_count + 1)
+            ))
+            for current_page in pages:
+                if current_page:
+                    all_articles.extend(current_page)
+            # A full last page means articles were added since the count was taken
+            if not pages[-1] or len(pages[-1]) < per_page:
+                print(f"  📚 Total articles found in folder: {len(all_articles)}")
+                return all_articles
+            page = page_count + 1
+
         while True:
             print(f"  📄 Fetching page {page} of articles...")
-            articles_url = f"{self.base_url}/solutions/folders/{folder_id}/articles?page={page}&per_page={per_page}"
-
-            current_page = await self.async_get(session, articles_url, headers)
+            current_page = await self.freshdesk.get_json(page_url(page))
 
             if not current_page or len(current_page) == 0:
                 break
@@ -588,199 +3001,521 @@ class FreshdeskKBBot:
 
         print(f"  📚 Total articles found in folder: {len(all_articles)}")
         return all_articles
-    
-    async def load_kb_articles(self):
-        """Fetch and cache all knowledge base articles with pagination"""
-        try:
-            print("\n=== Starting Knowledge Base Load with Debug Logging ===")
-            print(f"Current time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-            self.kb_cache = []  # Clear existing cache
 
-            auth_str = f"{self.freshdesk_api_key}:X"
-            auth_bytes = auth_str.encode('ascii')
-            base64_auth = base64.b64encode(auth_bytes).decode('ascii')
+    def split_passages(self, body):
+        """Split a stored article body into overlapping word windows small enough for the embedding model
 
-            headers = {
-                'Content-Type': 'application/json',
-                'Authorization': f'Basic {base64_auth}'
-            }
+        The body is whitespace-normalised UTF-8 as kept by ArticleStore; returns
+        the (start, end) byte span of each window within it.
+        """
+        words = body.split(b' ') if body else []
+        starts, ends, offset = [], [], 0
+        for word in words:
+            starts.append(offset)
+            ends.append(offset + len(word))
+            offset += len(word) + 1
+        if len(words) <= self.PASSAGE_WORDS:
+            return [(0, len(body))]
+
+        step = max(1, self.PASSAGE_WORDS - self.PASSAGE_OVERLAP)
+        spans = []
+        for start in range(0, len(words), step):
+            spans.append((starts[start], ends[min(start + self.PASSAGE_WORDS, len(words)) - 1]))
+            if start + self.PASSAGE_WORDS >= len(words):
+                break
+        return spans
+
+    def article_passages(self, store, position):
+        """Passage spans and embedding texts for one stored article"""
+        article, body = store[position], store.body_bytes(position)
+        spans = self.split_passages(body)
+        return spans, [self.article_embedding_text(article, body[start:end].decode('utf-8')) for start, end in spans]
+
+    def article_embedding_text(self, article, passage):
+        """Build the text that represents one passage of an article in the embedding index"""
+        return (
+            f"Category: {article['category']}\n"
+            f"Folder: {article['folder']}\n"
+            f"Title: {article['title']}\n\n"
+            f"{passage}"
+        )
 
-            async with aiohttp.ClientSession() as session:
-                # Test API connection first
-                test_url = f"{self.base_url}/solutions/categories"
-                async with session.get(test_url, headers=headers) as response:
-                    print(f"\n🔑 API Connection Test:")
-                    print(f"Status: {response.status}")
-                    print(f"Rate Limit Remaining: {response.headers.get('X-Ratelimit-Remaining', 'N/A')}")
-
-                    if response.status != 200:
-                        print(f"❌ API access error: {response.status}")
-                        return
-                    print("✅ API connection successful")
-
-                # Load categories
-                print("\n📚 Loading categories...")
-                categories = await self.async_get(session, f"{self.base_url}/solutions/categories", headers)
-
-                if not categories:
-                    print("❌ No categories returned from API")
-                    return
+    def build_passage_index(self, store):
+        """Split stored articles into passages and index their embeddings; blocking, so run it in a thread
+
+        Returns each passage's article position, its byte span within that
+        article's body, and the VectorIndex whose rows line up with them.
+        """
+        positions, spans, texts = [], [], []
+        for position in range(len(store)):
+            article_spans, article_texts = self.article_passages(store, position)
+            positions += [position] * len(article_spans)
+            spans += article_spans
+            texts += article_texts
+        embeddings = self.embedding_store.encode(texts, self.encode_texts)
+        self.embedding_store.prune(texts)
+        return positions, spans, VectorIndex(embeddings, self.VECTOR_INDEX_BACKEND)
+
+    def replace_article(self, kb, article_id, article):
+        """Build the KBIndex that follows `kb` with one article replaced, added or removed
+
+        Pass article=None to remove it. A new article, or one that moved to
+        another folder, is placed after the last one in its folder (or
+        category) so scope partitions stay contiguous.
+        Only the new article's passages are embedded; every other row is copied
+        from `kb`, which is left untouched. Blocking, so run it in a thread.
+        """
+        position = kb.positions.get(article_id)
+        # (position in kb, or None for the new version, article) in the new order
+        entries = list(enumerate(kb.articles))
+        placed = False
+        if position is not None:
+            current = entries[position][1]
+            if article is not None and (current['category'], current['folder']) == (article['category'], article['folder']):
+                entries[position] = (None, article)
+                placed = True
+            else:
+                # Removed, or moved to another folder: it must not stay inside its old partition
+                del entries[position]
+        if article is not None and not placed:
+            insert_at = len(entries)
+            for scope in ((article['category'], article['folder']), (article['category'],)):
+                matches = [i for i, (_, other) in enumerate(entries)
+                           if (other['category'], other['folder'])[:len(scope)] == scope]
+                if matches:
+                    insert_at = matches[-1] + 1
+                    break
+            entries.insert(insert_at, (None, article))
+        store = ArticleStore.build(
+            self.KB_SNAPSHOT_DIR, self.article_url_prefix, [entry for _, entry in entries], base=kb.articles
+        )
 
-                print(f"Found {len(categories)} total categories")
+        # Spans are relative to the article body, so copied rows stay valid in the new store
+        counts, source_rows, new_spans, texts = [], [], [], []
+        for new_position, (old_position, _) in enumerate(entries):
+            if old_position is None:
+                new_spans, texts = self.article_passages(store, new_position)
+                rows = [-1] * len(new_spans)
+            else:
+                rows = kb.passage_rows.get(old_position, [])
+            counts.append(len(rows))
+            source_rows += rows
+        source_rows = np.asarray(source_rows, dtype=np.int64)
+        copied = source_rows >= 0
+
+        positions = np.repeat(np.arange(len(entries), dtype=np.int32), counts)
+        spans = np.empty((len(source_rows), 2), dtype=np.int64)
+        spans[copied] = kb.passage_spans[source_rows[copied]]
+        vectors = np.empty((len(source_rows), kb.vectors.shape[1]), dtype=np.float32)
+        vectors[copied] = kb.vectors[source_rows[copied]]
+        if article is not None:
+            spans[~copied] = new_spans
+            vectors[~copied] = VectorIndex.normalize(self.embedding_store.encode(texts, self.encode_texts))
+
+        lexical = kb.lexical.copy()
+        lexical.remove(article_id)
+        if article is not None:
+            self.add_to_lexical_index(lexical, article)
+        # Only the changed article's rows are added to (or dropped from) the vector index
+        index = kb.index.updated(vectors, source_rows)
+        return KBIndex(store, positions, spans, index, lexical)
+
+    def add_to_lexical_index(self, index, article):
+        index.add(
+            article['id'],
+            f"{article['category']} {article['folder']} {article['description']}",
+            title=article['title']
+        )
 
-                for category in categories:
-                    category_name = category.get('name', '').strip()
-                    category_id = category.get('id', '')
+    def build_lexical_index(self, articles):
+        """Build the BM25 index over whole articles; blocking, so run it in a thread"""
+        index = BM25Index()
+        for article in articles:
+            self.add_to_lexical_index(index, article)
+        return index
 
-                    print(f"\n==== Category: {category_name} (ID: {category_id}) ====")
+    async def load_article(self, article, category_name, folder_name, previous=None):
+        """Fetch the full content of a listed article and build its cache entry
 
-                    if category_name.lower() not in [cat.lower() for cat in self.ALLOWED_CATEGORIES]:
-                        print(f"⏩ Skipping category {category_name} - not in allowed list")
-                        continue
+        If `previous` holds a cached copy with the same updated_at, it is reused
+        and the detail request is skipped.
+        """
+        article_id = str(article.get('id', ''))
+        article_status = article.get('status')
 
-                    print(f"✅ Processing allowed category: {category_name}")
+        if article_status != 2:
+            print(f"  ⏩ Skipping {article.get('title', 'No Title')} ({article_id}) - status is not published ({article_status})")
+            return None
 
-                    # Load folders
-                    folders_url = f"{self.base_url}/solutions/categories/{category_id}/folders"
-                    folders = await self.async_get(session, folders_url, headers)
+        cached = previous.get(article_id) if previous else None
+        if cached and (cached['category'], cached['folder']) != (category_name, folder_name):
+            cached = dict(cached, category=category_name, folder=folder_name)
+        if cached and article.get('updated_at') and cached.get('updated_at') == article.get('updated_at'):
+            return cached
 
-                    if not folders:
-                        print(f"⚠️ No folders found in category {category_name}")
-                        continue
+        full_article = await self.freshdesk.get_json(
+            f"{self.base_url}/solutions/articles/{article_id}", conditional=False
+        )
 
-                    print(f"Found {len(folders)} folders in category")
+        if not full_article:
+            if cached:
+                print(f"  ⚠️ Failed to fetch updated content for {article_id}, keeping the cached copy")
+                return cached
+            print(f"  ❌ Failed to fetch full article content for {article_id}")
+            return None
 
-                    for folder in folders:
-                        folder_name = folder.get('name', '')
-                        folder_id = folder.get('id', '')
-
-                        print(f"\n--- Folder: {folder_name} (ID: {folder_id}) ---")
-
-                        # Use the paginated method to get ALL articles
-                        articles = await self.get_all_articles_from_folder(session, folder_id, headers)
-
-                        if not articles:
-                            print(f"⚠️ No articles found in folder {folder_name}")
-                            continue
-
-                        print(f"Found {len(articles)} total articles in folder")
-
-                        for article in articles:
-                            article_id = str(article.get('id', ''))
-                            article_status = article.get('status')
-                            article_title = article.get('title', 'No Title')
-
-                            print(f"\nArticle: {article_title}")
-                            print(f"  ID: {article_id}")
-                            print(f"  Status: {article_status}")
-                            print(f"  Created: {article.get('created_at')}")
-                            print(f"  Updated: {article.get('updated_at')}")
-
-                            if article_status == 2:
-                                print("  ✅ Status is published (2)")
-                                article_url = f"https://{self.freshdesk_domain}.freshdesk.com/a/solutions/articles/{article_id}"
-
-                                # Get full article content
-                                full_article = await self.async_get(
-                                    session,
-                                    f"{self.base_url}/solutions/articles/{article_id}",
-                                    headers
-                                )
-
-                                if full_article:
-                                    self.kb_cache.append({
-                                        'title': full_article.get('title'),
-                                        'description': full_article.get('description_text', ''),
-                                        'url': article_url,
-                                        'category': category_name,
-                                        'folder': folder_name,
-                                        'id': article_id,
-                                        'status': article_status,
-                                        'created_at': full_article.get('created_at'),
-                                        'updated_at': full_article.get('updated_at')
-                                    })
-                                    print("  ✅ Successfully added to cache")
-                                else:
-                                    print("  ❌ Failed to fetch full article content")
-                            else:
-                                print(f"  ⏩ Skipping - status is not published ({article_status})")
-
-                # Final summary
-                print("\n=== Loading Summary ===")
-                print(f"Total articles cached: {len(self.kb_cache)}")
-
-                if self.kb_cache:
-                    print("\n🔄 Creating embeddings...")
-                    texts = [
-                        f"Category: {article['category']}\n"
-                        f"Folder: {article['folder']}\n"
-                        f"Title: {article['title']}\n\n"
-                        f"{article['description']}"
-                        for article in self.kb_cache
-                    ]
-                    self.kb_embeddings = self.model.encode(texts)
-                    print("✅ Created embeddings for all articles")
-
-                    # Print newest articles
-                    print("\n📅 Most Recent Articles:")
-                    sorted_articles = sorted(self.kb_cache, 
-                                          key=lambda x: x.get('updated_at', ''), 
-                                          reverse=True)
-                    for article in sorted_articles[:5]:
-                        print(f"- {article['title']} (Updated: {article['updated_at']})")
+        print(f"  ✅ {'Updated' if cached else 'Cached'} article: {full_article.get('title')} ({article_id})")
+        return self.article_entry(full_article, category_name, folder_name)
+
+    def article_entry(self, full_article, category_name, folder_name):
+        """Build the cached knowledge base entry for an article's details"""
+        article_id = str(full_article.get('id', ''))
+        return {
+            'title': full_article.get('title'),
+            'description': full_article.get('description_text', ''),
+            'url': self.article_url_prefix + article_id,
+            'category': category_name,
+            'folder': folder_name,
+            'id': article_id,
+            'status': full_article.get('status'),
+            'created_at': full_article.get('created_at'),
+            'updated_at': full_article.get('updated_at')
+        }
+
+    async def load_folder_articles(self, folder, category_name, previous=None):
+        """Fetch every published article in a folder concurrently"""
+        folder_name = folder.get('name', '')
+        folder_id = folder.get('id', '')
+
+        articles = await self.get_all_articles_from_folder(folder_id, folder.get('articles_count'))
+
+        if not articles:
+            print(f"⚠️ No articles found in folder {folder_name} (ID: {folder_id})")
+            return []
+
+        print(f"--- Folder: {folder_name} (ID: {folder_id}): {len(articles)} articles listed ---")
+
+        loaded = await asyncio.gather(*(
+            self.load_article(article, category_name, folder_name, previous)
+            for article in articles
+        ))
+        # Lets a webhook place a new article without looking up its folder and category
+        return [
+            article if article.get('folder_id') == str(folder_id) else dict(article, folder_id=str(folder_id))
+            for article in loaded if article
+        ]
+
+    async def load_category_articles(self, category, previous=None):
+        """Fetch every published article in a category, fanning out across its folders"""
+        category_name = category.get('name', '').strip()
+        category_id = category.get('id', '')
+
+        folders_url = f"{self.base_url}/solutions/categories/{category_id}/folders"
+        folders = await self.freshdesk.get_json(folders_url)
+
+        if not folders:
+            print(f"⚠️ No folders found in category {category_name}")
+            return []
+
+        print(f"==== Category: {category_name} (ID: {category_id}): {len(folders)} folders ====")
+
+        loaded = await asyncio.gather(*(
+            self.load_folder_articles(folder, category_name, previous)
+            for folder in folders
+        ))
+        return [article for folder_articles in loaded for article in folder_articles]
+
+    async def load_kb_articles(self, incremental=True):
+        """Fetch and cache all knowledge base articles with pagination
+
+        In incremental mode, articles whose updated_at matches the cached copy
+        are neither re-downloaded nor re-embedded; articles that are no longer
+        listed as published are dropped. Pass incremental=False to rebuild
+        everything from scratch.
+        """
+        async with self._kb_load_lock:
+            await self._load_kb_articles(incremental)
+
+    async def _load_kb_articles(self, incremental):
+        try:
+            mode = "incremental" if incremental and self.kb else "full"
+            print(f"\n=== Starting Knowledge Base Load ({mode}) with Debug Logging ===")
+            print(f"Current time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+            load_start = time.perf_counter()
+
+            old_articles = {article['id']: article for article in self.kb.articles}
+            previous = old_articles if mode == "incremental" else {}
+
+            freshdesk, limiter = self.freshdesk, self.freshdesk.limiter
+            requests_before, retries_before = limiter.request_count, freshdesk.retries
+            failures_before, not_modified_before = freshdesk.failures, freshdesk.not_modified
+
+            # Test API connection first; the response doubles as the category list
+            test_url = f"{self.base_url}/solutions/categories"
+            status, categories = await freshdesk.request('GET', test_url, conditional=True)
+            print(f"\n🔑 API Connection Test:")
+            print(f"Status: {status}")
+            print(f"Rate Limit Remaining: {limiter.rate_limit_remaining if limiter.rate_limit_remaining is not None else 'N/A'}")
+
+            if status != 200:
+                print(f"❌ API access error: {status}")
+                return
+            print("✅ API connection successful")
+
+            # Load categories
+            print("\n📚 Loading categories...")
+
+            if not categories:
+                print("❌ No categories returned from API")
+                return
+
+            print(f"Found {len(categories)} total categories")
+
+            allowed_categories = [cat.lower() for cat in self.ALLOWED_CATEGORIES]
+            selected_categories = []
+            for category in categories:
+                category_name = category.get('name', '').strip()
+                if category_name.lower() not in allowed_categories:
+                    print(f"⏩ Skipping category {category_name} - not in allowed list")
+                    continue
+                print(f"✅ Processing allowed category: {category_name}")
+                selected_categories.append(category)
+
+            loaded = await asyncio.gather(*(
+                self.load_category_articles(category, previous)
+                for category in selected_categories
+            ))
+            articles = [article for category_articles in loaded for article in category_articles]
+
+            crawl_seconds = time.perf_counter() - load_start
+            self.startup.record('crawl', crawl_seconds)
+            metrics.observe('kb_bot_stage_duration_seconds', crawl_seconds, pipeline='refresh', stage='crawl')
+
+            current_ids = {article['id'] for article in articles}
+            added = [a for a in articles if a['id'] not in old_articles]
+            changed = [a for a in articles
+                       if a['id'] in old_articles and a.get('updated_at') != old_articles[a['id']].get('updated_at')]
+            removed = [a for a_id, a in old_articles.items() if a_id not in current_ids]
+
+            failed_requests = freshdesk.failures - failures_before
+            if removed and failed_requests:
+                # An unlisted article may only have been missed by a failed request, so keep it until a clean crawl
+                print(f"⚠️ {failed_requests} Freshdesk request(s) failed; keeping {len(removed)} unlisted "
+                      f"article(s) from the previous load")
+                articles = articles + removed
+                removed = []
+
+            # Final summary
+            print("\n=== Loading Summary ===")
+            print(f"Total articles cached: {len(articles)}")
+            print(f"Added: {len(added)}, changed: {len(changed)}, "
+                  f"unchanged: {len(articles) - len(added) - len(changed)}, removed: {len(removed)}")
+            print(f"Freshdesk requests issued: {limiter.request_count - requests_before} "
+                  f"(max concurrency {limiter.max_concurrency}, "
+                  f"rate limit remaining {limiter.rate_limit_remaining if limiter.rate_limit_remaining is not None else 'N/A'}, "
+                  f"{freshdesk.retries - retries_before} retried, {failed_requests} failed, "
+                  f"{freshdesk.not_modified - not_modified_before} not modified)")
+            print(f"Crawl time: {crawl_seconds:.2f}s")
+
+            if articles:
+                # Unchanged articles keep their bodies in the current store's blob; a full load compacts it
+                store = await asyncio.to_thread(
+                    ArticleStore.build, self.KB_SNAPSHOT_DIR, self.article_url_prefix,
+                    ArticleStore.group_by_scope(articles), self.kb.articles if mode == "incremental" else None
+                )
+
+                print("\n🔄 Creating embeddings...")
+                embed_start = time.perf_counter()
+                positions, spans, index = await asyncio.to_thread(self.build_passage_index, store)
+                self.startup.record('embed', time.perf_counter() - embed_start)
+                metrics.observe('kb_bot_stage_duration_seconds', time.perf_counter() - embed_start,
+                                pipeline='refresh', stage='embed')
+
+                lexical_start = time.perf_counter()
+                if mode == "incremental" and self.kb.lexical is not None:
+                    # Re-index only what changed, in a copy: questions in flight keep using the current version
+                    lexical = self.kb.lexical.copy()
+                    for article in removed:
+                        lexical.remove(article['id'])
+                    for article in added + changed:
+                        self.add_to_lexical_index(lexical, article)
                 else:
-                    print("\n⚠️ No articles were cached")
+                    lexical = await asyncio.to_thread(self.build_lexical_index, store)
+
+                # Publish the complete new version in one step
+                self.kb = KBIndex(store, positions, spans, index, lexical)
+                metrics.observe('kb_bot_stage_duration_seconds', time.perf_counter() - lexical_start,
+                                pipeline='refresh', stage='lexical_index')
+                print(f"✅ Created embeddings for {len(positions)} passages from {len(store)} articles "
+                      f"({index.backend.name} index, {index.nbytes / 1024 / 1024:.1f} MiB)")
+                print(f"✅ BM25 index covers {len(lexical)} articles and {len(lexical.postings)} terms "
+                      f"({time.perf_counter() - lexical_start:.2f}s)")
+
+                # Print newest articles
+                print("\n📅 Most Recent Articles:")
+                sorted_articles = sorted(self.kb.articles, 
+                                      key=lambda x: x.get('updated_at', ''), 
+                                      reverse=True)
+                for article in sorted_articles[:5]:
+                    print(f"- {article['title']} (Updated: {article['updated_at']})")
+            else:
+                self.kb = KBIndex()
+                print("\n⚠️ No articles were cached")
+
+            stale_answers = self.answer_cache.invalidate(a['id'] for a in changed + removed)
+            if stale_answers:
+                print(f"Invalidated {stale_answers} cached answer(s) citing changed or removed articles")
+
+            if articles:
+                # Unchanged content only needs the snapshot's refreshed time bumped
+                if mode == "full" or added or changed or removed or self.snapshot_info is None:
+                    snapshot_info = await asyncio.to_thread(self.kb_snapshot.save, self.kb)
+                else:
+                    snapshot_info = await asyncio.to_thread(self.kb_snapshot.mark_fresh)
+                self.snapshot_info = snapshot_info or self.snapshot_info
+            self.kb_source = 'live'
+
+            load_seconds = time.perf_counter() - load_start
+            self.last_refresh = {'mode': mode, 'duration': load_seconds, 'finished': time.time()}
+            metrics.observe('kb_bot_stage_duration_seconds', load_seconds, pipeline='refresh', stage='total')
+            print(f"\n⏱️ Knowledge base load finished in {load_seconds:.2f}s "
+                  f"with {limiter.request_count - requests_before} Freshdesk requests")
 
         except Exception as e:
             print(f"\n❌ Error loading articles: {str(e)}")
             print("Traceback:", traceback.format_exc())
 
+    def handle_article_webhook(self, headers, payload):
+        """Authenticate an article webhook and schedule the update on the bot's loop; runs on the Flask thread
+
+        Returns the JSON body and HTTP status. The update itself happens in the
+        background, so Freshdesk gets its 202 without waiting for the fetch.
+        """
+        if not self.WEBHOOK_SECRET:
+            return {'error': 'webhook is disabled, set WEBHOOK_SECRET'}, 404
+
+        if not secret_matches(headers, 'X-Webhook-Secret', self.WEBHOOK_SECRET):
+            metrics.inc('kb_bot_webhook_events_total', event='unknown', outcome='unauthorized')
+            return {'error': 'unauthorized'}, 401
+
+        payload = payload if isinstance(payload, dict) else {}
+        article_id = str(payload.get('article_id', payload.get('id', ''))).strip()
+        event = self.ARTICLE_WEBHOOK_EVENTS.get(str(payload.get('event', 'update')).lower())
+        if not article_id.isdigit() or event is None:
+            metrics.inc('kb_bot_webhook_events_total', event='unknown', outcome='invalid')
+            return {'error': 'expected a numeric article_id and an event of '
+                             'create, update, publish or delete'}, 400
+
+        loop = self.loop
+        if loop is None or loop.is_closed():
+            return {'error': 'bot is not connected yet'}, 503
+
+        future = asyncio.run_coroutine_threadsafe(self.update_article(article_id, event), loop)
+
+        def report(done):
+            if not done.cancelled() and done.exception() is not None:
+                print(f"❌ Error applying webhook for article {article_id}: {str(done.exception())}")
+
+        future.add_done_callback(report)
+        return {'status': 'accepted', 'article_id': article_id, 'event': event}, 202
+
+    async def fetch_article(self, article_id):
+        """GET one article's details; returns the HTTP status and the JSON body (None unless 200)"""
+        return await self.freshdesk.request(
+            'GET', f"{self.base_url}/solutions/articles/{article_id}"
+        )
+
+    async def update_article(self, article_id, event):
+        """Bring one article up to date in the cache and indexes after a webhook
+
+        Costs a single Freshdesk request (none for deletes). Drafts, articles
+        that no longer exist and deletes are removed; new articles are only
+        added if their folder is already indexed, otherwise the next refresh
+        picks them up. Returns the outcome recorded in the webhook metrics.
+        """
+        start = time.perf_counter()
+        outcome = 'error'
+        try:
+            async with self._kb_load_lock:
+                kb = self.kb
+                if not kb or kb.index is None:
+                    print(f"⏩ Webhook for article {article_id} ignored, the knowledge base is not loaded yet")
+                    outcome = 'ignored'
+                    return outcome
+
+                entry = None
+                if event != 'delete':
+                    status, full_article = await self.fetch_article(article_id)
+                    if status not in (200, 404):
+                        print(f"❌ Webhook fetch of article {article_id} failed with status {status}")
+                        return outcome
+                    if full_article is not None and full_article.get('status') == 2:
+                        folder = kb.articles.folder_names(str(full_article.get('folder_id')))
+                        if folder is None:
+                            print(f"⏩ Article {article_id} is not in an indexed folder, leaving it to the next refresh")
+                            outcome = 'ignored'
+                            return outcome
+                        entry = dict(self.article_entry(full_article, *folder),
+                                     folder_id=str(full_article.get('folder_id')))
+
+                if entry is None and article_id not in kb.positions:
+                    outcome = 'ignored'
+                    return outcome
+
+                # Loads hold the same lock, so kb is still the published version here
+                kb = await asyncio.to_thread(self.replace_article, kb, article_id, entry)
+                self.kb = kb
+                self.answer_cache.invalidate([article_id])
+                outcome = 'removed' if entry is None else 'updated'
+                print(f"🪝 Webhook {event}: article {article_id} {outcome} in "
+                      f"{time.perf_counter() - start:.2f}s ({len(kb)} articles, {kb.passage_count} passages)")
+
+                self.snapshot_info = (
+                    await asyncio.to_thread(self.kb_snapshot.save, kb)
+                    or self.snapshot_info
+                )
+                return outcome
+        finally:
+            metrics.inc('kb_bot_webhook_events_total', event=event, outcome=outcome)
+            metrics.observe('kb_bot_stage_duration_seconds', time.perf_counter() - start,
+                            pipeline='webhook', stage='total')
+
     async def check_single_article(self):
         """Direct check of a specific article"""
         print("\n🔍 Running direct article check...")
 
-        auth_str = f"{self.freshdesk_api_key}:X"
-        auth_bytes = auth_str.encode('ascii')
-        base64_auth = base64.b64encode(auth_bytes).decode('ascii')
-
-        headers = {
-            'Content-Type': 'application/json',
-            'Authorization': f'Basic {base64_auth}'
-        }
-
-        async with aiohttp.ClientSession() as session:
-            # Check article directly
-            article_id = "151000201537"
-            article_url = f"{self.base_url}/solutions/articles/{article_id}"
-            print(f"\nChecking article at: {article_url}")
-
-            article = await self.async_get(session, article_url, headers)
-            if article:
-                print("\n✅ Article exists!")
-                print(f"Title: {article.get('title')}")
-                print(f"Status: {article.get('status')}")
-                print(f"Category ID: {article.get('category_id')}")
-                print(f"Folder ID: {article.get('folder_id')}")
-
-                # Get category info
-                category_url = f"{self.base_url}/solutions/categories/{article.get('category_id')}"
-                category = await self.async_get(session, category_url, headers)
-                if category:
-                    print(f"Category: {category.get('name')}")
-
-                # Get folder info
-                folder_url = f"{self.base_url}/solutions/folders/{article.get('folder_id')}"
-                folder = await self.async_get(session, folder_url, headers)
-                if folder:
-                    print(f"Folder: {folder.get('name')}")
-                    print(f"Folder Visibility: {folder.get('visibility')}")
-            else:
-                print("\n❌ Article not found or not accessible")
+        # Check article directly
+        article_id = "151000201537"
+        article_url = f"{self.base_url}/solutions/articles/{article_id}"
+        print(f"\nChecking article at: {article_url}")
+
+        article = await self.freshdesk.get_json(article_url, conditional=False)
+        if article:
+            print("\n✅ Article exists!")
+            print(f"Title: {article.get('title')}")
+            print(f"Status: {article.get('status')}")
+            print(f"Category ID: {article.get('category_id')}")
+            print(f"Folder ID: {article.get('folder_id')}")
+
+            # Get category info
+            category_url = f"{self.base_url}/solutions/categories/{article.get('category_id')}"
+            category = await self.freshdesk.get_json(category_url)
+            if category:
+                print(f"Category: {category.get('name')}")
+
+            # Get folder info
+            folder_url = f"{self.base_url}/solutions/folders/{article.get('folder_id')}"
+            folder = await self.freshdesk.get_json(folder_url)
+            if folder:
+                print(f"Folder: {folder.get('name')}")
+                print(f"Folder Visibility: {folder.get('visibility')}")
+        else:
+            print("\n❌ Article not found or not accessible")
     
     async def diagnose_kb_content(self):
         """Diagnose loaded knowledge base content with enhanced debugging"""
         print("\n🔍 Diagnosing Knowledge Base Content:")
-        print(f"Total articles in cache: {len(self.kb_cache)}")
+        print(f"Total articles in cache: {len(self.kb)}")
 
         # Search for specific article
         target_id = "151000201537"
@@ -790,7 +3525,7 @@ class FreshdeskKBBot:
         # Debug: Print all categories and their articles
         print("\n📊 Articles by Category:")
         category_articles = {}
-        for article in self.kb_cache:
+        for article in self.kb.articles:
             cat = article['category']
             if cat not in category_articles:
                 category_articles[cat] = []
@@ -811,7 +3546,7 @@ class FreshdeskKBBot:
         # Only do detailed URL check if we found the target article
         if found:
             print("\n🔍 Detailed URL Check:")
-            for article in self.kb_cache:
+            for article in self.kb.articles:
                 current_url = article['url']
                 if target_id in current_url:
                     print(f"\nPotential match found:")
@@ -823,82 +3558,178 @@ class FreshdeskKBBot:
 
     # Add this to your bot's command handlers:
 
-    async def find_relevant_articles(self, question, num_articles=3):
-        """Find the most relevant articles for a question"""
-        if not self.kb_cache or not self.model:
+    async def find_relevant_articles(self, question, num_articles=3, question_embedding=None, kb=None, scope=None):
+        """Find the most relevant articles for a question, optionally reusing its embedding
+
+        Articles are ranked by fusing the cosine similarity of their best passage
+        with their BM25 match, so exact product codes and titles are not missed.
+        Searches `kb`, or the version published when the call starts; given a
+        scope partition from kb.scope(), only that slice of the index is searched.
+        """
+        if kb is None:
+            kb = self.kb
+        if not kb or kb.index is None:
             return []
 
         try:
-            # Create embedding for the question
-            question_embedding = self.model.encode([question])
-
-            if self.kb_embeddings is None:
-                print("Creating embeddings for cached articles...")
-                texts = [
-                    f"Category: {article['category']}\n"
-                    f"Folder: {article['folder']}\n"
-                    f"Title: {article['title']}\n\n"
-                    f"{article['description']}"
-                    for article in self.kb_cache
-                ]
-                self.kb_embeddings = self.model.encode(texts)
-                print("Embeddings created successfully")
-
-            # Calculate similarity scores
-            similarities = cosine_similarity(question_embedding, self.kb_embeddings)[0]
-
-            # Get top matches
-            top_indices = similarities.argsort()[-num_articles:][::-1]
-            top_scores = similarities[top_indices]
-            top_matches = [self.kb_cache[i] for i in top_indices]
-
-            relevant_articles = []
-            for match, score in zip(top_matches, top_scores):
-                if score > 0.2:  # Include articles with reasonable relevance
-                    relevant_articles.append({
-                        'title': match['title'],
-                        'content': match['description'],
-                        'category': match['category'],
-                        'folder': match['folder'],
-                        'url': match['url'],
-                        'score': score
-                    })
-
-            return relevant_articles
+            if question_embedding is None:
+                # Create embedding for the question off the event loop
+                question_embedding = await self.query_encoder.encode(question)
+
+            # Dense candidates; fetch extra passages since several may belong to one article
+            top_indices, top_scores = kb.index.search(
+                question_embedding, num_articles * 5, rows=scope['rows'] if scope is not None else None
+            )
+            candidates = {
+                int(kb.passage_positions[index])
+                for index, score in zip(top_indices, top_scores) if score > self.RETRIEVAL_MIN_SCORE
+            }
+
+            # Lexical candidates
+            lexical_matches = self.lexical_matches(kb, question, num_articles * 3, scope)
+            candidates.update(position for position, match in lexical_matches.items() if match >= 0.5)
+
+            query = np.asarray(question_embedding, dtype=np.float32).reshape(-1)
+            query = query / (np.linalg.norm(query) or 1.0)
+            weight = self.HYBRID_LEXICAL_WEIGHT
+
+            ranked = []
+            for position in candidates:
+                rows = kb.passage_rows.get(position)
+                if not rows or (scope is not None and not kb.in_scope(scope, position)):
+                    continue
+                passage_scores = kb.vectors[rows] @ query
+                dense = float(passage_scores.max())
+                lexical = lexical_matches.get(position, 0.0)
+                if dense <= self.RETRIEVAL_MIN_SCORE and lexical < 0.5:  # Include articles with reasonable relevance
+                    continue
+                ranked.append(((1 - weight) * dense + weight * lexical, position, passage_scores))
+
+            ranked.sort(key=lambda item: item[0], reverse=True)
+            return [
+                self.relevant_article(kb, position, question, score, passage_scores)
+                for score, position, passage_scores in ranked[:num_articles]
+            ]
         except Exception as e:
             print(f"Error finding relevant articles: {str(e)}")
             return []
 
-    async def get_gpt_answer(self, question):
-        """Get GPT to answer the question based on relevant articles"""
-        try:
-            # Find relevant articles
-            relevant_articles = await self.find_relevant_articles(question)
+    def lexical_matches(self, kb, question, k, scope=None):
+        """BM25 match strength (0-1, see BM25Index.reference_score) of the top k articles by cache position"""
+        if kb.lexical is None:
+            return {}
+        reference = kb.lexical.reference_score(question) or 1.0
+        docs = kb.scope_ids(scope) if scope is not None else None
+        return {
+            kb.positions[article_id]: min(1.0, score / reference)
+            for article_id, score in kb.lexical.search(question, k, docs)
+            if article_id in kb.positions
+        }
 
-            if not relevant_articles:
-                return (
-                    "I couldn't find any relevant information in our knowledge base. "
-                    "Please try:\n"
-                    "• Rephrasing your question\n"
-                    "• Being more specific\n"
-                    "• Asking about a different topic\n\n"
-                    "Available categories:\n"
-                    "• General Info\n"
-                    "• Training Programme (Customer Success)\n"
-                    "• Workflow\n"
-                    "• Corporate Gift Products\n"
-                    "• Product Specific Articles"
-                )
+    def lexical_fast_path(self, kb, question, scope=None):
+        """Retrieve from the BM25 index alone when one article clearly matches the question's keywords
 
-            # Prepare context from relevant articles
-            context = "Information from our knowledge base:\n\n"
-            for article in relevant_articles:
-                context += f"Article: {article['title']}\n"
-                context += f"Category: {article['category']} > {article['folder']}\n"
-                context += f"Content: {article['content']}\n\n"
+        Returns the matching article in find_relevant_articles' format, or None
+        when the keyword match is not confident enough and the hybrid path is needed.
+        """
+        if kb.lexical is None or not kb:
+            return None
+
+        hits = kb.lexical.search(question, 2, kb.scope_ids(scope) if scope is not None else None)
+        if not hits or hits[0][0] not in kb.positions:
+            return None
+        if len(hits) > 1 and hits[0][1] < self.LEXICAL_FAST_PATH_MARGIN * hits[1][1]:
+            return None
+        match = min(1.0, hits[0][1] / (kb.lexical.reference_score(question) or 1.0))
+        if match < self.LEXICAL_FAST_PATH_MIN_MATCH:
+            return None
+
+        return [self.relevant_article(kb, kb.positions[hits[0][0]], question, match)]
 
-            # Prepare prompt for GPT
-            prompt = f"""You are a helpful customer service assistant. Use the following information from our knowledge base to answer the user's question. 
+    def relevant_article(self, kb, position, question, score, passage_scores=None):
+        """Build a retrieval result for the article at `position` from its best passages
+
+        Passages are ranked by how many of the question's keywords they contain,
+        blended with their cosine similarity when `passage_scores` is given.
+        """
+        article = kb.articles[position]
+        rows = kb.passage_rows.get(position, [])
+        # Only the passages of the top hits are ever read from the article blob
+        passages = [kb.passage_text(row) for row in rows]
+        keywords = set(BM25Index.tokenize(question))
+        ranking = np.array([
+            len(keywords & set(BM25Index.tokenize(passage))) / (len(keywords) or 1)
+            for passage in passages
+        ])
+        if passage_scores is not None:
+            weight = self.HYBRID_LEXICAL_WEIGHT
+            ranking = (1 - weight) * passage_scores + weight * ranking
+
+        # Keep the best passages, in reading order
+        best = sorted(np.argsort(-ranking, kind='stable')[:self.MAX_PASSAGES_PER_ARTICLE])
+        return {
+            'title': article['title'],
+            'content': "\n...\n".join(passages[i] for i in best),
+            'category': article['category'],
+            'folder': article['folder'],
+            'url': article['url'],
+            'id': article['id'],
+            'score': score
+        }
+
+    async def get_gpt_answer(self, question, on_update=None):
+        """Get GPT to answer the question based on relevant articles
+
+        The completion is streamed; if given, `on_update` is awaited with the
+        accumulated answer text as tokens arrive.
+        """
+        result = await self.answer_question(question, on_update)
+        return result['answer']
+
+    def report_retrieval_latency(self, path, start):
+        seconds = time.perf_counter() - start
+        self.retrieval_latency.record(path, seconds)
+        metrics.inc('kb_bot_retrievals_total', path=path.replace(' ', '_'))
+        metrics.observe('kb_bot_stage_duration_seconds', seconds,
+                        pipeline='answer', stage='retrieval_' + path.replace(' ', '_'))
+        print(f"🔎 Retrieval via {path} took {seconds * 1000:.1f} ms "
+              f"({self.retrieval_latency.summary(path)})")
+
+    def normalize_question(self, question):
+        """Canonical form used to recognise identical questions"""
+        return re.sub(r'\s+', ' ', question.lower()).strip().rstrip('?!. ')
+
+    def answer_key(self, question, scope=None):
+        """Single-flight key: identical questions in the same scope share one answer"""
+        key = self.normalize_question(question)
+        return f"[{scope.lower()}] {key}" if scope else key
+
+    async def answer_question(self, question, on_update=None, question_embedding=None, scope=None,
+                              source=None, channel=None, on_queued=None):
+        """Answer a question from the knowledge base, serving near-repeats from the answer cache
+
+        Returns a dict with the answer text, the articles it was based on and
+        whether it was a cache hit. Identical questions that are already being
+        answered share the in-flight result instead of starting another one.
+        Pass `question_embedding` if the question has already been embedded,
+        and a category or 'category/folder' name as `scope` to only search there.
+        Given a `source`, the answer waits its turn in the request scheduler
+        (see RequestScheduler.submit); callers joining an in-flight answer
+        never take a worker of their own. Raises SchedulerBusy if the queue is full.
+        """
+        async def answer(broadcast):
+            if source is None:
+                return await self._answer_question(question, broadcast, question_embedding, scope)
+            return await self.scheduler.submit(
+                lambda: self._answer_question(question, broadcast, question_embedding, scope),
+                source=source, channel=channel, on_queued=on_queued
+            )
+
+        return await self.inflight_answers.run(self.answer_key(question, scope), answer, on_update)
+
+    def prompt_messages(self, question, context):
+        """Chat messages asking GPT to answer a question from the given knowledge base context"""
+        prompt = f"""You are a helpful customer service assistant. Use the following information from our knowledge base to answer the user's question. 
 
 Knowledge Base Context:
 {context}
@@ -914,29 +3745,171 @@ Important Guidelines:
 
 Your response should be in Discord-compatible markdown format.
 """
+        return [
+            {"role": "system", "content": "You are a helpful customer service assistant who answers questions based on the company's knowledge base articles."},
+            {"role": "user", "content": prompt}
+        ]
 
-            # Get response from GPT
-            chat_completion = self.openai_client.chat.completions.create(
-                model="gpt-4-turbo-preview",
-                messages=[
-                    {"role": "system", "content": "You are a helpful customer service assistant who answers questions based on the company's knowledge base articles."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=1000,
-                temperature=0.3
+    def format_context_article(self, article, content):
+        return (
+            f"Article: {article['title']}\n"
+            f"Category: {article['category']} > {article['folder']}\n"
+            f"Content: {content}\n\n"
+        )
+
+    def select_context_articles(self, articles):
+        """Decide how many retrieved articles to offer the model from their score distribution
+
+        Keeps up to MAX_CONTEXT_ARTICLES articles scoring at least
+        CONTEXT_RELATIVE_SCORE times the best one, so a clear winner is sent
+        alone while several comparable matches are all kept.
+        """
+        ranked = sorted(articles, key=lambda article: article['score'], reverse=True)
+        if not ranked:
+            return []
+        cutoff = ranked[0]['score'] * self.CONTEXT_RELATIVE_SCORE
+        return [article for article in ranked if article['score'] >= cutoff][:self.MAX_CONTEXT_ARTICLES]
+
+    def assemble_prompt(self, question, articles):
+        """Build the chat messages for a question within PROMPT_TOKEN_BUDGET
+
+        Articles are added best first. The first one that does not fit is trimmed
+        if at least MIN_TRIMMED_ARTICLE_TOKENS of it fit (the best article is
+        always kept), and the rest are dropped. Returns the messages, the
+        articles actually included and the prompt's token count.
+        """
+        context = "Information from our knowledge base:\n\n"
+        remaining = self.PROMPT_TOKEN_BUDGET - self.token_counter.count_messages(self.prompt_messages(question, context))
+
+        included = []
+        for article in articles:
+            block = self.format_context_article(article, article['content'])
+            block_tokens = self.token_counter.count(block)
+            if block_tokens > remaining:
+                available = remaining - self.token_counter.count(self.format_context_article(article, " ..."))
+                if included and available < self.MIN_TRIMMED_ARTICLE_TOKENS:
+                    break
+                available = max(available, self.MIN_TRIMMED_ARTICLE_TOKENS)
+                block = self.format_context_article(
+                    article, self.token_counter.truncate(article['content'], available) + " ..."
+                )
+                print(f"✂️ Trimmed '{article['title']}' to {available} content tokens to fit the prompt budget")
+                context += block
+                included.append(article)
+                break
+            context += block
+            remaining -= block_tokens
+            included.append(article)
+
+        if len(included) < len(articles):
+            print(f"Dropped {len(articles) - len(included)} lower-scoring article(s) over the prompt budget")
+
+        messages = self.prompt_messages(question, context)
+        return messages, included, self.token_counter.count_messages(messages)
+
+    def record_token_usage(self, tokens):
+        self.token_usage['requests'] += 1
+        self.token_usage['prompt'] += tokens['prompt']
+        self.token_usage['completion'] += tokens['completion']
+        metrics.inc('kb_bot_tokens_total', tokens['prompt'], kind='prompt')
+        metrics.inc('kb_bot_tokens_total', tokens['completion'], kind='completion')
+        print(f"🧮 Tokens: prompt {tokens['prompt']}, completion {tokens['completion']} "
+              f"(averages over {self.token_usage['requests']} requests: "
+              f"prompt {self.token_usage['prompt'] / self.token_usage['requests']:.0f}, "
+              f"completion {self.token_usage['completion'] / self.token_usage['requests']:.0f})")
+
+    async def _answer_question(self, question, on_update=None, embedding=None, scope=None):
+        try:
+            # Answer from the version published now, even if a refresh replaces it meanwhile
+            kb = self.kb
+            partition = kb.scope(scope) if scope else None
+            if not kb or (scope and partition is None):
+                return {'answer': self.NO_RESULTS_MESSAGE, 'articles': [], 'cache_hit': False, 'tokens': None}
+            scope = partition['name'] if partition is not None else None
+
+            retrieval_start = time.perf_counter()
+            question_embedding = None
+            relevant_articles = self.lexical_fast_path(kb, question, partition)
+            if relevant_articles:
+                # A confident keyword match needs neither the embedding model nor the answer cache
+                self.report_retrieval_latency('lexical fast path', retrieval_start)
+            else:
+                # Embed the question once; the cache lookup and retrieval share it
+                question_embedding = embedding
+                if question_embedding is None:
+                    with metrics.timer('kb_bot_stage_duration_seconds', pipeline='answer', stage='embed'):
+                        question_embedding = await self.query_encoder.encode(question)
+
+                with metrics.timer('kb_bot_stage_duration_seconds', pipeline='answer', stage='cache_lookup'):
+                    cached = self.answer_cache.get(question_embedding, scope)
+                if cached is not None:
+                    print(f"💾 Answer cache hit for question: {question}")
+                    return {'answer': cached['answer'], 'articles': cached['articles'], 'cache_hit': True, 'tokens': None}
+
+                # Find relevant articles
+                with metrics.timer('kb_bot_stage_duration_seconds', pipeline='answer', stage='search'):
+                    relevant_articles = await self.find_relevant_articles(
+                        question, self.MAX_CONTEXT_ARTICLES, question_embedding=question_embedding, kb=kb,
+                        scope=partition
+                    )
+                self.report_retrieval_latency('hybrid', retrieval_start)
+
+            if not relevant_articles:
+                return {'answer': self.NO_RESULTS_MESSAGE, 'articles': [], 'cache_hit': False, 'tokens': None}
+
+            # Fit the best articles into the prompt's token budget
+            with metrics.timer('kb_bot_stage_duration_seconds', pipeline='answer', stage='prompt'):
+                messages, relevant_articles, prompt_tokens = self.assemble_prompt(
+                    question, self.select_context_articles(relevant_articles)
+                )
+
+            # Stream the response from GPT
+            openai_start = time.perf_counter()
+            stream = await self.openai_client.chat.completions.create(
+                model=self.OPENAI_MODEL,
+                messages=messages,
+                max_tokens=self.MAX_COMPLETION_TOKENS,
+                temperature=0.3,
+                stream=True
             )
 
-            answer = chat_completion.choices[0].message.content.strip()
+            parts = []
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if not parts:
+                        metrics.observe('kb_bot_stage_duration_seconds', time.perf_counter() - openai_start,
+                                        pipeline='answer', stage='openai_first_token')
+                    parts.append(delta)
+                    if on_update is not None:
+                        await on_update(''.join(parts))
+
+            metrics.observe('kb_bot_stage_duration_seconds', time.perf_counter() - openai_start,
+                            pipeline='answer', stage='openai')
+            answer = ''.join(parts).strip()
+            tokens = {'prompt': prompt_tokens, 'completion': self.token_counter.count(answer)}
+            self.record_token_usage(tokens)
 
             # Add footer with source articles
             footer = "\n\n**Sources:**\n"
             for article in relevant_articles:
                 footer += f"• [{article['title']}]({article['url']}) - {article['category']}\n"
 
-            return answer + footer
+            answer += footer
+            # A refresh published meanwhile has already invalidated what it changed; don't re-cache a stale answer
+            if question_embedding is not None and kb is self.kb:
+                self.answer_cache.put(question_embedding, answer, relevant_articles, scope)
+            return {'answer': answer, 'articles': relevant_articles, 'cache_hit': False, 'tokens': tokens}
 
         except Exception as e:
-            return f"I encountered an error while processing your question: {str(e)}\n\nPlease try again in a moment."
+            return {
+                'answer': f"I encountered an error while processing your question: {str(e)}\n\nPlease try again in a moment.",
+                'articles': [],
+                'cache_hit': False,
+                'tokens': None
+            }
 
     def run(self):
         """Start the Discord bot"""
@@ -964,6 +3937,9 @@ if __name__ == "__main__":
         if missing_vars:
             raise ValueError(f"Missing environment variables: {', '.join(missing_vars)}")
 
+        # Start the keep alive server first so health checks pass during warm-up
+        keep_alive()
+
         print("Initializing bot...")
         kb_bot = FreshdeskKBBot(
             required_env_vars["DISCORD_TOKEN"],
@@ -977,9 +3953,6 @@ if __name__ == "__main__":
         print(f"Initialization completed in {time.time() - start_time:.2f} seconds")
         print("Starting bot...")
 
-        # Start the keep alive server
-        keep_alive()
-
         # Run the bot
         kb_bot.run()  # Use the class method to run
 